@@ -9,6 +9,7 @@ from scipy.misc import imresize as resize
 from scipy.misc import toimage as toimage
 from gym.spaces.box import Box
 from gym.utils import seeding
+from rnn.rnn import rnn_next_mixture
 
 SCREEN_X = 64
 SCREEN_Y = 64
@@ -32,13 +33,19 @@ def get_pi_idx(x, pdf):
 	return -1
 
 
+def proxy_reward(z, expected_z):
+	# the MDN-RNN predicts no reward or done: the distance the rnn expects the view to move from state z,
+	# about none when stalled, only what the dynamics of the state and action predict, not the sampling noise
+	return float(np.sqrt(np.sum(np.square(expected_z - z))))
+
+
 class CarRacingDream(gym.Env):
 	metadata = {
 		'render.modes': ['human', 'rgb_array'],
 		'video.frames_per_second': 60
 	}
 
-	def __init__(self, agent):
+	def __init__(self, agent, proxy_reward=False):
 		self.observation_space = Box(low=-50., high=50., shape=(32))  # , dtype=np.float32
 		self._seed()
 		self.agent = agent
@@ -50,6 +57,8 @@ class CarRacingDream(gym.Env):
 		self.z = None
 		self.temperature = 0.7
 		self.vae_frame = None
+		self.use_proxy_reward = proxy_reward  # reward each step w/ proxy_reward, else 0 as before
+		self.expected_z = None
 		self._reset()
 
 	def _seed(self, seed=None):
@@ -70,23 +79,14 @@ class CarRacingDream(gym.Env):
 		return self.z
 
 	def _sample_next_z(self, action):
-		s_model = self.rnn
 		temperature = self.temperature
 
-		sess = s_model.sess
-		hps = s_model.hps
-
-		OUTWIDTH = hps.output_seq_width
-
-		prev_x = np.zeros((1, 1, OUTWIDTH))
-		prev_x[0][0] = self.z
-
-		strokes = np.zeros((1, OUTWIDTH), dtype=np.float32)
+		OUTWIDTH = self.rnn.hps.output_seq_width
 
-		input_x = np.concatenate((prev_x, action.reshape(1, 1, 3)), axis=2)
-		feed = {s_model.input_x: input_x, s_model.initial_state: self.agent.state}
-		[logmix, mean, logstd, self.agent.state] = sess.run(
-			[s_model.out_logmix, s_model.out_mean, s_model.out_logstd, s_model.final_state], feed)
+		# TF or NumpyMDNRNN, whichever the agent was made with
+		logmix, mean, logstd, self.agent.state = rnn_next_mixture(self.rnn, self.z, action, self.agent.state)
+		if self.use_proxy_reward:
+			self.expected_z = np.sum(np.exp(logmix) * mean, axis=1)  # mean of the mixture, logmix is normalized
 
 		# adjust temperatures
 		logmix2 = np.copy(logmix) / temperature
@@ -114,6 +114,8 @@ class CarRacingDream(gym.Env):
 		self.frame_count += 1
 		next_z = self._sample_next_z(action)
 		reward = 0
+		if self.use_proxy_reward:
+			reward = proxy_reward(self.z, self.expected_z)
 		done = False
 		if self.frame_count > 1200:
 			done = True
@@ -153,8 +155,8 @@ class CarRacingDream(gym.Env):
 			self.viewer.imshow(img)
 
 
-def make_env(env_name, agent, seed=-1, render_mode=False):
-	env = CarRacingDream(agent)
+def make_env(env_name, agent, seed=-1, render_mode=False, proxy_reward=False):
+	env = CarRacingDream(agent, proxy_reward=proxy_reward)
 	if seed < 0:
 		seed = np.random.randint(2 ** 31 - 1)
 	env.seed(seed)
@@ -10,7 +10,7 @@ from dream_env import make_env
 import time
 
 from vae.vae import ConvVAE
-from rnn.rnn import hps_sample, MDNRNN, rnn_init_state, rnn_next_state, rnn_output, rnn_output_size
+from rnn.rnn import hps_sample, make_rnn, rnn_init_state, rnn_next_state, rnn_output, rnn_output_size
 
 render_mode = True
 
@@ -24,9 +24,9 @@ MODE_ZH = 4
 EXP_MODE = MODE_ZH
 
 
-def make_model(load_model=True):
+def make_model(load_model=True, numpy_rnn=False):
 	# can be extended in the future.
-	model = Model(load_model=load_model)
+	model = Model(load_model=load_model, numpy_rnn=numpy_rnn)
 	return model
 
 
@@ -58,11 +58,11 @@ def sample(p):
 class Model:
 	''' simple one layer model for car racing '''
 
-	def __init__(self, load_model=True):
+	def __init__(self, load_model=True, numpy_rnn=False):
 		self.env_name = "carracing"
 		self.vae = ConvVAE(batch_size=1, gpu_mode=False, is_training=False, reuse=True)
 
-		self.rnn = MDNRNN(hps_sample, gpu_mode=False, reuse=True)
+		self.rnn = make_rnn(hps_sample, numpy_rnn)  # the dream env steps this rnn too
 
 		if load_model:
 			self.vae.load_json('vae/vae.json')
@@ -88,9 +88,9 @@ class Model:
 
 		self.render_mode = False
 
-	def make_env(self, seed=-1, render_mode=False):
+	def make_env(self, seed=-1, render_mode=False, proxy_reward=False):
 		self.render_mode = render_mode
-		self.env = make_env(self.env_name, agent=self, seed=seed)
+		self.env = make_env(self.env_name, agent=self, seed=seed, proxy_reward=proxy_reward)
 
 	def reset(self):
 		self.state = rnn_init_state(self.rnn)
@@ -181,23 +181,26 @@ def simulate(model, train_mode=False, render_mode=True, num_episode=5, seed=-1,
 
 		z = model.env.reset()
 
+		total_reward = 0.0
+
 		for t in range(max_episode_length):
 
 			action = model.get_action(z)
 
 			if render_mode:
-				model.env.render("human")
-			else:
-				model.env.render('rgb_array')
+				model.env.render("human")  # decoding z is only needed to look at the dream
 
 			z, reward, done, info = model.env.step(action)
 
 			if (render_mode):
 				print("action", action, "sum.square.z", np.sum(np.square(z)))
 
+			total_reward += reward
+
 			if done:
 				break
 
+		reward_list.append(total_reward)
 		t_list.append(t)
 
 	return reward_list, t_list
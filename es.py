@@ -1,5 +1,10 @@
+import pickle
+import threading
 import numpy as np
 
+# held while an optimizer that samples from np.random (cma) has its own random state swapped in
+global_random_lock = threading.Lock()
+
 
 def compute_ranks(x):
 	"""
@@ -25,13 +30,75 @@ def compute_centered_ranks(x):
 
 def compute_weight_decay(weight_decay, model_param_list):
 	model_param_grid = np.array(model_param_list)
-	return - weight_decay * np.mean(model_param_grid * model_param_grid, axis=1)
+	# row wise sum of squares without a temporary of the size of the population
+	return - weight_decay * np.einsum('ij,ij->i', model_param_grid, model_param_grid) / model_param_grid.shape[1]
+
+
+def get_attributes(obj, prefix=''):
+	'''The attributes of obj named in its state_names, as arrays keyed by prefix + name.
+	Settings (popsize, num_params, ...) and the samples of the current generation are not state,
+	they are rebuilt by the constructor from the command line and by the next ask.'''
+	state = {}
+	for name in obj.state_names:
+		if hasattr(obj, name):  # e.g. curr_best_reward is only set by the first tell
+			state[prefix + name] = np.array(getattr(obj, name))  # a copy, tell updates some in place
+	return state
+
+
+def set_attributes(obj, state, prefix=''):
+	for name in obj.state_names:
+		if prefix + name not in state:
+			continue
+		value = state[prefix + name]
+		current = getattr(obj, name, None)
+		if isinstance(current, np.ndarray):
+			assert current.shape == value.shape, "checkpoint does not fit the settings: shape of " + name
+		elif value.ndim == 0:
+			value = value.item()  # back to a python number
+		setattr(obj, name, value)
+
+
+class SharedNoiseTable(object):
+	'''Block of gaussian noise that every rank builds deterministically from the same seed.
+	A perturbation is then identified by its offset into the block.
+	(https://github.com/openai/evolution-strategies-starter/blob/master/es_distributed/es.py)
+	'''
+
+	def __init__(self, size=10000000, seed=123):
+		self.noise = np.random.RandomState(seed).randn(size).astype(np.float32)
+
+	def get(self, i, dim):
+		return self.noise[i:i + dim]
+
+	def get_rows(self, index, dim):
+		return self.noise[np.asarray(index).reshape(-1, 1) + np.arange(dim)]
+
+	def sample_index(self, n, dim, rng=np.random):
+		return rng.randint(0, len(self.noise) - dim + 1, size=n)
+
+
+def noise_chunks(noise_table, keys, num_params, chunk_size=256):
+	'''Yields (start, stop, noise) over the float32 noise rows named by keys, chunk_size rows at a time.
+	keys are offsets into noise_table, or seeds of one generator per row if there is no table.
+	noise is a buffer that is reused for the next chunk.'''
+	buffer = np.empty((min(chunk_size, len(keys)), num_params), dtype=np.float32)
+	for start in range(0, len(keys), chunk_size):
+		stop = min(start + chunk_size, len(keys))
+		noise = buffer[:stop - start]
+		if noise_table is not None:
+			noise[:] = noise_table.get_rows(keys[start:stop], num_params)
+		else:
+			for i in range(stop - start):
+				np.random.default_rng(keys[start + i]).standard_normal(num_params, dtype=np.float32, out=noise[i])
+		yield start, stop, noise
 
 
 # adopted from:
 # https://github.com/openai/evolution-strategies-starter/blob/master/es_distributed/optimizers.py
 
 class Optimizer(object):
+	state_names = ['t']
+
 	def __init__(self, pi, epsilon=1e-08):
 		self.pi = pi
 		self.dim = pi.num_params
@@ -61,6 +128,8 @@ class BasicSGD(Optimizer):
 
 
 class SGD(Optimizer):
+	state_names = ['t', 'v']
+
 	def __init__(self, pi, stepsize, momentum=0.9):
 		Optimizer.__init__(self, pi)
 		self.v = np.zeros(self.dim, dtype=np.float32)
@@ -73,6 +142,8 @@ class SGD(Optimizer):
 
 
 class Adam(Optimizer):
+	state_names = ['t', 'm', 'v']
+
 	def __init__(self, pi, stepsize, beta1=0.99, beta2=0.999):
 		Optimizer.__init__(self, pi)
 		self.stepsize = stepsize
@@ -92,15 +163,19 @@ class Adam(Optimizer):
 class CMAES:
 	'''CMA-ES wrapper.'''
 
+	state_names = []  # cma keeps its state in python objects, see get_state
+
 	def __init__(self, num_params,  # number of model parameters
 				 sigma_init=0.10,  # initial standard deviation
 				 popsize=255,  # population size
-				 weight_decay=0.01):  # weight decay coefficient
+				 weight_decay=0.01,  # weight decay coefficient
+				 rng=None):  # RandomState the samples are drawn from, np.random if None
 
 		self.num_params = num_params
 		self.sigma_init = sigma_init
 		self.popsize = popsize
 		self.weight_decay = weight_decay
+		self.rng = np.random if rng is None else rng
 		self.solutions = None
 
 		import cma
@@ -115,7 +190,13 @@ class CMAES:
 
 	def ask(self):
 		'''returns a list of parameters'''
-		self.solutions = np.array(self.es.ask())
+		with global_random_lock:
+			# cma samples from np.random, for the time of the call that is the random state of this optimizer
+			saved_state = np.random.get_state()
+			np.random.set_state(self.rng.get_state())
+			self.solutions = np.array(self.es.ask())
+			self.rng.set_state(np.random.get_state())
+			np.random.set_state(saved_state)
 		return self.solutions
 
 	def tell(self, reward_table_result):
@@ -138,10 +219,140 @@ class CMAES:
 		r = self.es.result
 		return (r[0], -r[1], -r[1], r[6])
 
+	def get_state(self):
+		state = get_attributes(self)
+		state['es'] = np.frombuffer(pickle.dumps(self.es), dtype=np.uint8)  # cma keeps its state in python objects
+		return state
+
+	def set_state(self, state):
+		es = pickle.loads(state['es'].tobytes())
+		assert es.popsize == self.popsize, "checkpoint does not fit the settings: popsize " + str(es.popsize)
+		self.es = es
+		set_attributes(self, state)
+
+
+class SepCMAES:
+	'''Separable CMA-ES: diagonal covariance, O(n) per sample and no eigendecomposition.
+	(Ros and Hansen, A Simple Modification in CMA-ES Achieving Linear Time and Space Complexity, 2008)'''
+
+	state_names = ['mu', 'sigma', 'C', 'D', 'pc', 'ps', 'generation', 'best_mu', 'best_reward', 'curr_best_reward',
+				   'first_interation']
+
+	def __init__(self, num_params,  # number of model parameters
+				 sigma_init=0.10,  # initial standard deviation
+				 popsize=255,  # population size
+				 weight_decay=0.01,  # weight decay coefficient
+				 rng=None):  # RandomState the samples are drawn from, np.random if None
+
+		self.num_params = num_params
+		self.sigma_init = sigma_init
+		self.popsize = popsize
+		self.weight_decay = weight_decay
+		self.rng = np.random if rng is None else rng
+		self.solutions = None
+
+		n = self.num_params
+		# recombination weights of the best half of the population
+		self.parents = int(self.popsize / 2)
+		weights = np.log(self.parents + 0.5) - np.log(np.arange(1, self.parents + 1))
+		self.weights = weights / np.sum(weights)
+		self.mueff = 1. / np.sum(self.weights ** 2)
+
+		# learning rates, c1 and cmu scaled up by (n + 2) / 3 for the diagonal model
+		self.cc = (4. + self.mueff / n) / (n + 4. + 2. * self.mueff / n)
+		self.cs = (self.mueff + 2.) / (n + self.mueff + 5.)
+		c1 = 2. / ((n + 1.3) ** 2 + self.mueff)
+		cmu = 2. * (self.mueff - 2. + 1. / self.mueff) / ((n + 2.) ** 2 + self.mueff)
+		self.c1 = min(1., c1 * (n + 2.) / 3.)
+		self.cmu = min(1. - self.c1, cmu * (n + 2.) / 3.)
+		self.damps = 1. + 2. * max(0., np.sqrt((self.mueff - 1.) / (n + 1.)) - 1.) + self.cs
+		self.chi_n = np.sqrt(n) * (1. - 1. / (4. * n) + 1. / (21. * n * n))
+
+		self.mu = np.zeros(n)
+		self.sigma = self.sigma_init
+		self.C = np.ones(n)  # diagonal of the covariance matrix
+		self.D = np.ones(n)  # sqrt(C)
+		self.pc = np.zeros(n)
+		self.ps = np.zeros(n)
+		self.generation = 0
+
+		self.best_mu = np.zeros(n)
+		self.best_reward = 0
+		self.curr_best_reward = 0
+		self.first_interation = True
+
+	def rms_stdev(self):
+		sigma = self.sigma * self.D
+		return np.mean(np.sqrt(sigma * sigma))
+
+	def ask(self):
+		'''returns a list of parameters'''
+		z = self.rng.randn(self.popsize, self.num_params)
+		z *= self.sigma * self.D
+		z += self.mu
+		self.solutions = z
+		return self.solutions
+
+	def tell(self, reward_table_result):
+		# input must be a numpy float array
+		assert (len(reward_table_result) == self.popsize), "Inconsistent reward_table size reported."
+		reward = np.array(reward_table_result, dtype=np.float64)
+		if self.weight_decay > 0:
+			l2_decay = compute_weight_decay(self.weight_decay, self.solutions)
+			reward += l2_decay
+
+		idx = np.argsort(reward)[::-1]
+		self.curr_best_reward = reward[idx[0]]
+		if self.first_interation or (self.curr_best_reward > self.best_reward):
+			self.first_interation = False
+			self.best_reward = self.curr_best_reward
+			self.best_mu = np.copy(self.solutions[idx[0]])
+
+		n = self.num_params
+		self.generation += 1
+		y = (self.solutions[idx[:self.parents]] - self.mu) / self.sigma  # steps of the selected parents
+		y_w = np.dot(self.weights, y)
+		self.mu += self.sigma * y_w
+
+		# evolution paths, C^(-1/2) is 1 / D for a diagonal C
+		self.ps = (1. - self.cs) * self.ps + np.sqrt(self.cs * (2. - self.cs) * self.mueff) * (y_w / self.D)
+		norm_ps = np.linalg.norm(self.ps)
+		hsig = norm_ps / np.sqrt(1. - (1. - self.cs) ** (2 * self.generation)) / self.chi_n < 1.4 + 2. / (n + 1.)
+		self.pc = (1. - self.cc) * self.pc + hsig * np.sqrt(self.cc * (2. - self.cc) * self.mueff) * y_w
+
+		# rank one and rank mu update of the diagonal
+		c1a = self.c1 * (1. - (1. - hsig) * self.cc * (2. - self.cc))
+		self.C *= 1. - c1a - self.cmu
+		self.C += self.c1 * self.pc * self.pc + self.cmu * np.dot(self.weights, y * y)
+		self.D = np.sqrt(self.C)
+
+		self.sigma *= np.exp(min(1., (self.cs / self.damps) * (norm_ps / self.chi_n - 1.)))
+
+	def current_param(self):
+		return self.mu
+
+	def set_mu(self, mu):
+		self.mu = np.array(mu)
+
+	def best_param(self):
+		return self.best_mu
+
+	def result(self):  # return best params so far, along with historically best reward, curr reward, sigma
+		return (self.best_mu, self.best_reward, self.curr_best_reward, self.sigma * self.D)
+
+	def get_state(self):
+		return get_attributes(self)
+
+	def set_state(self, state):
+		set_attributes(self, state)
+
 
 class SimpleGA:
 	'''Simple Genetic Algorithm.'''
 
+	state_names = ['sigma', 'elite_params', 'elite_rewards', 'best_param', 'best_reward', 'curr_best_reward',
+				   'first_iteration']
+
 	def __init__(self, num_params,  # number of model parameters
 				 sigma_init=0.1,  # initial standard deviation
 				 sigma_decay=0.999,  # anneal standard deviation
@@ -150,7 +361,7 @@ class SimpleGA:
 				 elite_ratio=0.1,  # percentage of the elites
 				 forget_best=False,  # forget the historical best elites
 				 weight_decay=0.01,  # weight decay coefficient
-				 ):
+				 rng=None):  # RandomState the samples are drawn from, np.random if None
 
 		self.num_params = num_params
 		self.sigma_init = sigma_init
@@ -163,35 +374,28 @@ class SimpleGA:
 
 		self.sigma = self.sigma_init
 		self.elite_params = np.zeros((self.elite_popsize, self.num_params))
-		self.elite_rewards = np.zeros(self.elite_popsize)
+		self.elite_rewards = np.full(self.elite_popsize, -np.inf)  # ranked below any reward until replaced
 		self.best_param = np.zeros(self.num_params)
 		self.best_reward = 0
 		self.first_iteration = True
 		self.forget_best = forget_best
 		self.weight_decay = weight_decay
+		self.rng = np.random if rng is None else rng
 
 	def rms_stdev(self):
 		return self.sigma  # same sigma for all parameters.
 
 	def ask(self):
 		'''returns a list of parameters'''
-		self.epsilon = np.random.randn(self.popsize, self.num_params) * self.sigma
-		solutions = []
-
-		def mate(a, b):
-			c = np.copy(a)
-			idx = np.where(np.random.rand((c.size)) > 0.5)
-			c[idx] = b[idx]
-			return c
-
-		elite_range = range(self.elite_popsize)
-		for i in range(self.popsize):
-			idx_a = np.random.choice(elite_range)
-			idx_b = np.random.choice(elite_range)
-			child_params = mate(self.elite_params[idx_a], self.elite_params[idx_b])
-			solutions.append(child_params + self.epsilon[i])
-
-		solutions = np.array(solutions)
+		self.epsilon = self.rng.randn(self.popsize, self.num_params)
+		self.epsilon *= self.sigma
+
+		# uniform crossover of two random elites per child, all children at once
+		idx_a = self.rng.randint(self.elite_popsize, size=self.popsize)
+		idx_b = self.rng.randint(self.elite_popsize, size=self.popsize)
+		mask = self.rng.randint(2, size=(self.popsize, self.num_params), dtype=bool)
+		solutions = np.where(mask, self.elite_params[idx_b], self.elite_params[idx_a])
+		solutions += self.epsilon
 		self.solutions = solutions
 
 		return solutions
@@ -199,24 +403,31 @@ class SimpleGA:
 	def tell(self, reward_table_result):
 		# input must be a numpy float array
 		assert (len(reward_table_result) == self.popsize), "Inconsistent reward_table size reported."
+		self.tell_partial(self.solutions, reward_table_result)
 
+	def tell_partial(self, solutions, reward_table_result, weights=None):
+		'''update from any set of evaluated solutions, e.g. a quorum of asynchronous results.
+		weights are ignored: the fitness of a solution does not go stale.'''
 		reward_table = np.array(reward_table_result)
 
 		if self.weight_decay > 0:
-			l2_decay = compute_weight_decay(self.weight_decay, self.solutions)
+			l2_decay = compute_weight_decay(self.weight_decay, solutions)
 			reward_table += l2_decay
 
 		if (not self.forget_best or self.first_iteration):
 			reward = reward_table
-			solution = self.solutions
+			solution = solutions
 		else:
 			reward = np.concatenate([reward_table, self.elite_rewards])
-			solution = np.concatenate([self.solutions, self.elite_params])
+			solution = np.concatenate([solutions, self.elite_params])
 
 		idx = np.argsort(reward)[::-1][0:self.elite_popsize]
 
-		self.elite_rewards = reward[idx]
-		self.elite_params = solution[idx]
+		# w/ fewer solutions than elites (a small async quorum) the best previous elites fill the places left,
+		# so ask and the checkpoint always see elite_popsize rows
+		missing = self.elite_popsize - len(idx)
+		self.elite_rewards = np.concatenate([reward[idx], self.elite_rewards[:missing]])
+		self.elite_params = np.concatenate([solution[idx], self.elite_params[:missing]])
 
 		self.curr_best_reward = self.elite_rewards[0]
 
@@ -240,10 +451,19 @@ class SimpleGA:
 	def result(self):  # return best params so far, along with historically best reward, curr reward, sigma
 		return (self.best_param, self.best_reward, self.curr_best_reward, self.sigma)
 
+	def get_state(self):
+		return get_attributes(self)
+
+	def set_state(self, state):
+		set_attributes(self, state)
+
 
 class OpenES:
 	''' Basic Version of OpenAI Evolution Strategies.'''
 
+	state_names = ['mu', 'sigma', 'learning_rate', 'best_mu', 'best_reward', 'curr_best_mu', 'curr_best_reward',
+				   'first_interation']
+
 	def __init__(self, num_params,  # number of model parameters
 				 sigma_init=0.1,  # initial standard deviation
 				 sigma_decay=0.999,  # anneal standard deviation
@@ -255,7 +475,10 @@ class OpenES:
 				 antithetic=False,  # whether to use antithetic sampling
 				 weight_decay=0.01,  # weight decay coefficient
 				 rank_fitness=True,  # use rank rather than fitness numbers
-				 forget_best=True):  # forget historical best
+				 forget_best=True,  # forget historical best
+				 noise_table=None,  # draw the noise from a SharedNoiseTable
+				 low_memory=False,  # float32 solutions, noise regenerated from per-row seeds instead of kept
+				 rng=None):  # RandomState the samples are drawn from, np.random if None
 
 		self.num_params = num_params
 		self.sigma_decay = sigma_decay
@@ -281,6 +504,9 @@ class OpenES:
 		self.rank_fitness = rank_fitness
 		if self.rank_fitness:
 			self.forget_best = True  # always forget the best one if we rank
+		self.noise_table = noise_table
+		self.low_memory = low_memory
+		self.rng = np.random if rng is None else rng
 		# choose optimizer
 		self.optimizer = Adam(self, learning_rate)
 
@@ -290,17 +516,66 @@ class OpenES:
 
 	def ask(self):
 		'''returns a list of parameters'''
+		if self.low_memory:
+			return self.ask_low_memory()
 		# antithetic sampling
-		if self.antithetic:
-			self.epsilon_half = np.random.randn(self.half_popsize, self.num_params)
+		if self.noise_table is not None:
+			# solution i is mu + noise_sign[i] * sigma * noise_table[noise_index[i]:]
+			if self.antithetic:
+				index = self.noise_table.sample_index(self.half_popsize, self.num_params, self.rng)
+				self.epsilon_half = self.noise_table.get_rows(index, self.num_params).astype(np.float64)
+				self.epsilon = np.concatenate([self.epsilon_half, - self.epsilon_half])
+				self.noise_index = np.concatenate([index, index])
+				self.noise_sign = np.concatenate([np.ones(self.half_popsize), - np.ones(self.half_popsize)])
+			else:
+				self.noise_index = self.noise_table.sample_index(self.popsize, self.num_params, self.rng)
+				self.epsilon = self.noise_table.get_rows(self.noise_index, self.num_params).astype(np.float64)
+				self.noise_sign = np.ones(self.popsize)
+		elif self.antithetic:
+			self.epsilon_half = self.rng.randn(self.half_popsize, self.num_params)
 			self.epsilon = np.concatenate([self.epsilon_half, - self.epsilon_half])
 		else:
-			self.epsilon = np.random.randn(self.popsize, self.num_params)
+			self.epsilon = self.rng.randn(self.popsize, self.num_params)
 
 		self.solutions = self.mu.reshape(1, self.num_params) + self.epsilon * self.sigma
 
 		return self.solutions
 
+	def ask_low_memory(self):
+		'''like ask, but only the float32 solutions are kept. the noise is named by noise_keys and
+		regenerated in chunks by tell.'''
+		n = self.half_popsize if self.antithetic else self.popsize
+		if self.noise_table is not None:
+			self.noise_keys = self.noise_table.sample_index(n, self.num_params, self.rng)
+			self.noise_index = self.noise_keys
+			self.noise_sign = np.ones(self.popsize)
+			if self.antithetic:
+				self.noise_index = np.concatenate([self.noise_keys, self.noise_keys])
+				self.noise_sign[n:] = -1
+		else:
+			self.noise_keys = self.rng.randint(2 ** 31 - 1, size=n)
+
+		solutions = np.empty((self.popsize, self.num_params), dtype=np.float32)
+		mu = self.mu.astype(np.float32)
+		for start, stop, noise in noise_chunks(self.noise_table, self.noise_keys, self.num_params):
+			noise *= self.sigma
+			np.add(mu, noise, out=solutions[start:stop])
+			if self.antithetic:
+				np.subtract(mu, noise, out=solutions[n + start:n + stop])
+		self.solutions = solutions
+		return solutions
+
+	def noise_dot(self, weights):
+		'''sum of weights[i] * noise of solution i, the noise regenerated chunk by chunk.'''
+		n = len(self.noise_keys)
+		if self.antithetic:
+			weights = weights[:n] - weights[n:]
+		weights = weights.astype(np.float32)
+		result = np.zeros(self.num_params)
+		for start, stop, noise in noise_chunks(self.noise_table, self.noise_keys, self.num_params):
+			result += np.dot(weights[start:stop], noise)
+		return result
+
 	def tell(self, reward_table_result):
 		# input must be a numpy float array
 		assert (len(reward_table_result) == self.popsize), "Inconsistent reward_table size reported."
@@ -317,7 +592,7 @@ class OpenES:
 		idx = np.argsort(reward)[::-1]
 
 		best_reward = reward[idx[0]]
-		best_mu = self.solutions[idx[0]]
+		best_mu = np.array(self.solutions[idx[0]], dtype=np.float64)
 
 		self.curr_best_reward = best_reward
 		self.curr_best_mu = best_mu
@@ -334,7 +609,10 @@ class OpenES:
 		# main bit:
 		# standardize the rewards to have a gaussian distribution
 		normalized_reward = (reward - np.mean(reward)) / np.std(reward)
-		change_mu = 1. / (self.popsize * self.sigma) * np.dot(self.epsilon.T, normalized_reward)
+		if self.low_memory:
+			change_mu = 1. / (self.popsize * self.sigma) * self.noise_dot(normalized_reward)
+		else:
+			change_mu = 1. / (self.popsize * self.sigma) * np.dot(self.epsilon.T, normalized_reward)
 
 		# self.mu += self.learning_rate * change_mu
 
@@ -348,6 +626,47 @@ class OpenES:
 		if (self.learning_rate > self.learning_rate_limit):
 			self.learning_rate *= self.learning_rate_decay
 
+	def tell_partial(self, solutions, reward_table_result, weights=None):
+		'''update from any set of evaluated solutions, e.g. a quorum of asynchronous results.
+		solutions may come from older search distributions, their noise is taken relative to the current mu.
+		weights down-weight stale solutions.'''
+		solutions = np.array(solutions)
+		reward = np.array(reward_table_result, dtype=np.float64)
+		if weights is None:
+			weights = np.ones(len(reward))
+
+		if self.rank_fitness:
+			reward = compute_centered_ranks(reward)
+
+		if self.weight_decay > 0:
+			l2_decay = compute_weight_decay(self.weight_decay, solutions)
+			reward += l2_decay
+
+		idx = np.argsort(reward)[::-1]
+
+		self.curr_best_reward = reward[idx[0]]
+		self.curr_best_mu = solutions[idx[0]]
+
+		if self.first_interation or self.forget_best or (self.curr_best_reward > self.best_reward):
+			self.first_interation = False
+			self.best_mu = self.curr_best_mu
+			self.best_reward = self.curr_best_reward
+
+		epsilon = (solutions - self.mu.reshape(1, self.num_params)) / self.sigma
+		reward_mean = np.average(reward, weights=weights)
+		reward_std = np.sqrt(np.average((reward - reward_mean) ** 2, weights=weights))
+		normalized_reward = (reward - reward_mean) / reward_std
+		change_mu = 1. / (np.sum(weights) * self.sigma) * np.dot(epsilon.T, weights * normalized_reward)
+
+		self.optimizer.stepsize = self.learning_rate
+		update_ratio = self.optimizer.update(-change_mu)
+
+		if (self.sigma > self.sigma_limit):
+			self.sigma *= self.sigma_decay
+
+		if (self.learning_rate > self.learning_rate_limit):
+			self.learning_rate *= self.learning_rate_decay
+
 	def current_param(self):
 		return self.curr_best_mu
 
@@ -360,10 +679,22 @@ class OpenES:
 	def result(self):  # return best params so far, along with historically best reward, curr reward, sigma
 		return (self.best_mu, self.best_reward, self.curr_best_reward, self.sigma)
 
+	def get_state(self):
+		state = get_attributes(self)
+		state.update(get_attributes(self.optimizer, 'optimizer.'))
+		return state
+
+	def set_state(self, state):
+		set_attributes(self, state)
+		set_attributes(self.optimizer, state, 'optimizer.')
+
 
 class PEPG:
 	'''Extension of PEPG with bells and whistles.'''
 
+	state_names = ['mu', 'sigma', 'learning_rate', 'best_mu', 'best_reward', 'curr_best_mu', 'curr_best_reward',
+				   'first_interation']
+
 	def __init__(self, num_params,  # number of model parameters
 				 sigma_init=0.10,  # initial standard deviation
 				 sigma_alpha=0.20,  # learning rate for standard deviation
@@ -378,7 +709,10 @@ class PEPG:
 				 average_baseline=True,  # set baseline to average of batch
 				 weight_decay=0.01,  # weight decay coefficient
 				 rank_fitness=True,  # use rank rather than fitness numbers
-				 forget_best=True):  # don't keep the historical best solution
+				 forget_best=True,  # don't keep the historical best solution
+				 noise_table=None,  # draw the noise from a SharedNoiseTable
+				 low_memory=False,  # float32 solutions, noise regenerated from per-row seeds instead of kept
+				 rng=None):  # RandomState the samples are drawn from, np.random if None
 
 		self.num_params = num_params
 		self.sigma_init = sigma_init
@@ -417,6 +751,9 @@ class PEPG:
 		self.rank_fitness = rank_fitness
 		if self.rank_fitness:
 			self.forget_best = True  # always forget the best one if we rank
+		self.noise_table = noise_table
+		self.low_memory = low_memory
+		self.rng = np.random if rng is None else rng
 		# choose optimizer
 		self.optimizer = Adam(self, learning_rate)
 
@@ -426,8 +763,21 @@ class PEPG:
 
 	def ask(self):
 		'''returns a list of parameters'''
+		if self.low_memory:
+			return self.ask_low_memory()
 		# antithetic sampling
-		self.epsilon = np.random.randn(self.batch_size, self.num_params) * self.sigma.reshape(1, self.num_params)
+		if self.noise_table is not None:
+			# solution i is mu + noise_sign[i] * sigma * noise_table[noise_index[i]:], or mu if noise_index[i] < 0
+			index = self.noise_table.sample_index(self.batch_size, self.num_params, self.rng)
+			noise = self.noise_table.get_rows(index, self.num_params).astype(np.float64)
+			self.epsilon = noise * self.sigma.reshape(1, self.num_params)
+			self.noise_index = np.concatenate([index, index])
+			self.noise_sign = np.concatenate([np.ones(self.batch_size), - np.ones(self.batch_size)])
+			if not self.average_baseline:
+				self.noise_index = np.concatenate([[-1], self.noise_index])
+				self.noise_sign = np.concatenate([[1], self.noise_sign])
+		else:
+			self.epsilon = self.rng.randn(self.batch_size, self.num_params) * self.sigma.reshape(1, self.num_params)
 		self.epsilon_full = np.concatenate([self.epsilon, - self.epsilon])
 		if self.average_baseline:
 			epsilon = self.epsilon_full
@@ -438,6 +788,45 @@ class PEPG:
 		self.solutions = solutions
 		return solutions
 
+	def ask_low_memory(self):
+		'''like ask, but only the float32 solutions are kept. the noise is named by noise_keys and
+		regenerated in chunks by tell.'''
+		if self.noise_table is not None:
+			self.noise_keys = self.noise_table.sample_index(self.batch_size, self.num_params, self.rng)
+			self.noise_index = np.concatenate([self.noise_keys, self.noise_keys])
+			self.noise_sign = np.concatenate([np.ones(self.batch_size), - np.ones(self.batch_size)])
+			if not self.average_baseline:
+				self.noise_index = np.concatenate([[-1], self.noise_index])
+				self.noise_sign = np.concatenate([[1], self.noise_sign])
+		else:
+			self.noise_keys = self.rng.randint(2 ** 31 - 1, size=self.batch_size)
+
+		solutions = np.empty((self.popsize, self.num_params), dtype=np.float32)
+		mu = self.mu.astype(np.float32)
+		offset = 0
+		if not self.average_baseline:
+			solutions[0] = mu
+			offset = 1
+		for start, stop, noise in noise_chunks(self.noise_table, self.noise_keys, self.num_params):
+			noise *= self.sigma
+			np.add(mu, noise, out=solutions[offset + start:offset + stop])
+			np.subtract(mu, noise, out=solutions[offset + self.batch_size + start:offset + self.batch_size + stop])
+		self.solutions = solutions
+		return solutions
+
+	def noise_dot(self, weights, square_weights=None):
+		'''sum of weights[k] * noise[k] (and of square_weights[k] * noise[k] ** 2) over the unscaled noise
+		of the batch, regenerated chunk by chunk.'''
+		weights = weights.astype(np.float32)
+		result = np.zeros(self.num_params)
+		result_square = np.zeros(self.num_params)
+		for start, stop, noise in noise_chunks(self.noise_table, self.noise_keys, self.num_params):
+			result += np.dot(weights[start:stop], noise)
+			if square_weights is not None:
+				noise *= noise
+				result_square += np.dot(square_weights[start:stop].astype(np.float32), noise)
+		return result, result_square
+
 	def tell(self, reward_table_result):
 		# input must be a numpy float array
 		assert (len(reward_table_result) == self.popsize), "Inconsistent reward_table size reported."
@@ -466,7 +855,10 @@ class PEPG:
 
 		best_reward = reward[idx[0]]
 		if (best_reward > b or self.average_baseline):
-			best_mu = self.mu + self.epsilon_full[idx[0]]
+			if self.low_memory:
+				best_mu = np.array(self.solutions[reward_offset + idx[0]], dtype=np.float64)
+			else:
+				best_mu = self.mu + self.epsilon_full[idx[0]]
 			best_reward = reward[idx[0]]
 		else:
 			best_mu = self.mu
@@ -486,17 +878,29 @@ class PEPG:
 				self.best_reward = self.curr_best_reward
 
 		# short hand
-		epsilon = self.epsilon
 		sigma = self.sigma
 
+		rT = (reward[:self.batch_size] - reward[self.batch_size:])
+		reward_avg = (reward[:self.batch_size] + reward[self.batch_size:]) / 2.0
+		rS = reward_avg - b
+		if self.low_memory:
+			# one pass over the regenerated noise, with epsilon = sigma * noise:
+			# rT . epsilon = sigma * (rT . noise), rS . S = sigma * (rS . noise ** 2 - sum(rS))
+			noise_rT, noise_rS = self.noise_dot(rT, rS if self.sigma_alpha > 0 else None)
+
 		# update the mean
 
 		# move mean to the average of the best idx means
 		if self.use_elite:
-			self.mu += self.epsilon_full[idx].mean(axis=0)
+			if self.low_memory:
+				self.mu += self.solutions[reward_offset + idx].mean(axis=0, dtype=np.float64) - self.mu
+			else:
+				self.mu += self.epsilon_full[idx].mean(axis=0)
 		else:
-			rT = (reward[:self.batch_size] - reward[self.batch_size:])
-			change_mu = np.dot(rT, epsilon)
+			if self.low_memory:
+				change_mu = sigma * noise_rT
+			else:
+				change_mu = np.dot(rT, self.epsilon)
 			self.optimizer.stepsize = self.learning_rate
 			update_ratio = self.optimizer.update(-change_mu)  # adam, rmsprop, momentum, etc.
 		# self.mu += (change_mu * self.learning_rate) # normal SGD method
@@ -507,10 +911,12 @@ class PEPG:
 			stdev_reward = 1.0
 			if not self.rank_fitness:
 				stdev_reward = reward.std()
-			S = ((epsilon * epsilon - (sigma * sigma).reshape(1, self.num_params)) / sigma.reshape(1, self.num_params))
-			reward_avg = (reward[:self.batch_size] + reward[self.batch_size:]) / 2.0
-			rS = reward_avg - b
-			delta_sigma = (np.dot(rS, S)) / (2 * self.batch_size * stdev_reward)
+			if self.low_memory:
+				delta_sigma = sigma * (noise_rS - np.sum(rS)) / (2 * self.batch_size * stdev_reward)
+			else:
+				epsilon = self.epsilon
+				S = ((epsilon * epsilon - (sigma * sigma).reshape(1, self.num_params)) / sigma.reshape(1, self.num_params))
+				delta_sigma = (np.dot(rS, S)) / (2 * self.batch_size * stdev_reward)
 
 			# adjust sigma according to the adaptive sigma calculation
 			# for stability, don't let sigma move more than 10% of orig value
@@ -525,6 +931,73 @@ class PEPG:
 		if (self.learning_rate_decay < 1 and self.learning_rate > self.learning_rate_limit):
 			self.learning_rate *= self.learning_rate_decay
 
+	def tell_partial(self, solutions, reward_table_result, weights=None):
+		'''update from any set of evaluated solutions, e.g. a quorum of asynchronous results.
+		solutions may come from older search distributions, their noise is taken relative to the current mu.
+		weights down-weight stale solutions.
+		with complete antithetic pairs and equal weights this matches tell() with an average baseline.'''
+		solutions = np.array(solutions)
+		reward = np.array(reward_table_result, dtype=np.float64)
+		if weights is None:
+			weights = np.ones(len(reward))
+
+		if self.rank_fitness:
+			reward = compute_centered_ranks(reward)
+
+		if self.weight_decay > 0:
+			l2_decay = compute_weight_decay(self.weight_decay, solutions)
+			reward += l2_decay
+
+		b = np.average(reward, weights=weights)  # baseline
+		epsilon = solutions - self.mu.reshape(1, self.num_params)
+		sigma = self.sigma
+
+		if self.use_elite:
+			idx = np.argsort(reward)[::-1][0:self.elite_popsize]
+		else:
+			idx = np.argsort(reward)[::-1]
+
+		self.curr_best_reward = reward[idx[0]]
+		self.curr_best_mu = solutions[idx[0]]
+
+		if self.first_interation:
+			self.sigma = np.ones(self.num_params) * self.sigma_init
+			sigma = self.sigma
+			self.first_interation = False
+			self.best_reward = self.curr_best_reward
+			self.best_mu = self.curr_best_mu
+		elif self.forget_best or (self.curr_best_reward > self.best_reward):
+			self.best_mu = self.curr_best_mu
+			self.best_reward = self.curr_best_reward
+
+		# rescale to the size of a full batch
+		scale = 2 * self.batch_size / np.sum(weights)
+
+		if self.use_elite:
+			self.mu += np.average(epsilon[idx], axis=0, weights=weights[idx])
+		else:
+			change_mu = scale * np.dot(weights * (reward - b), epsilon)
+			self.optimizer.stepsize = self.learning_rate
+			update_ratio = self.optimizer.update(-change_mu)
+
+		if (self.sigma_alpha > 0):
+			stdev_reward = 1.0
+			if not self.rank_fitness:
+				stdev_reward = np.sqrt(np.average((reward - b) ** 2, weights=weights))
+			S = ((epsilon * epsilon - (sigma * sigma).reshape(1, self.num_params)) / sigma.reshape(1, self.num_params))
+			delta_sigma = np.dot(weights * (reward - b), S) / (2 * np.sum(weights) * stdev_reward)
+
+			change_sigma = self.sigma_alpha * delta_sigma
+			change_sigma = np.minimum(change_sigma, self.sigma_max_change * self.sigma)
+			change_sigma = np.maximum(change_sigma, - self.sigma_max_change * self.sigma)
+			self.sigma += change_sigma
+
+		if (self.sigma_decay < 1):
+			self.sigma[self.sigma > self.sigma_limit] *= self.sigma_decay
+
+		if (self.learning_rate_decay < 1 and self.learning_rate > self.learning_rate_limit):
+			self.learning_rate *= self.learning_rate_decay
+
 	def current_param(self):
 		return self.curr_best_mu
 
@@ -536,3 +1009,314 @@ class PEPG:
 
 	def result(self):  # return best params so far, along with historically best reward, curr reward, sigma
 		return (self.best_mu, self.best_reward, self.curr_best_reward, self.sigma)
+
+	def get_state(self):
+		state = get_attributes(self)
+		state.update(get_attributes(self.optimizer, 'optimizer.'))
+		return state
+
+	def set_state(self, state):
+		set_attributes(self, state)
+		set_attributes(self.optimizer, state, 'optimizer.')
+
+
+class AsyncES:
+	'''Steady-state driver for OpenES, PEPG and SimpleGA.
+	Candidates are handed out one at a time and the optimizer is updated as soon as a quorum of
+	results has arrived, so the workers never wait for the slowest evaluations of a generation.'''
+
+	def __init__(self, es,  # OpenES, PEPG or SimpleGA
+				 quorum=0.8,  # fraction of popsize results that triggers an update
+				 max_staleness=2,  # discard results that are older than this many updates
+				 staleness_decay=0.5):  # weight of a result is staleness_decay ** age
+		assert hasattr(es, 'tell_partial'), "optimizer does not support asynchronous updates."
+		self.es = es
+		self.popsize = es.popsize
+		self.quorum = quorum
+		self.quorum_size = max(int(np.ceil(self.popsize * self.quorum)), 2)
+		self.max_staleness = max_staleness
+		self.staleness_decay = staleness_decay
+
+		self.generation = 0
+		self.next_id = 0
+		self.batch = []  # candidates of the current search distribution
+		self.batch_index = 0
+		self.jobs = {}  # job id -> (solution, generation)
+		self.results = []  # (job id, solution, reward, weight)
+		self.num_stale = 0  # stale results used in the last update
+		self.num_discarded = 0  # results discarded so far
+
+	def ask(self):
+		'''returns job id, index within the current batch and parameters of the next candidate'''
+		if self.batch_index >= len(self.batch):
+			# keep sampling from the current distribution until the quorum is reached
+			self.batch = self.es.ask()
+			self.batch_index = 0
+		i = self.batch_index
+		solution = np.copy(self.batch[i])
+		self.batch_index += 1
+		job_id = self.next_id
+		self.next_id += 1
+		self.jobs[job_id] = (solution, self.generation)
+		return job_id, i, solution
+
+	def tell(self, job_id, reward):
+		'''returns False if the result is too stale and was discarded'''
+		solution, generation = self.jobs.pop(job_id)
+		age = self.generation - generation
+		if age > self.max_staleness:
+			self.num_discarded += 1
+			return False
+		self.results.append((job_id, solution, reward, self.staleness_decay ** age))
+		return True
+
+	def ready(self):
+		return len(self.results) >= self.quorum_size
+
+	def update(self):
+		'''updates the optimizer from the collected results, returns the job ids that were used'''
+		job_ids, solutions, rewards, weights = zip(*self.results)
+		weights = np.array(weights)
+		self.num_stale = int(np.sum(weights < 1))
+		self.es.tell_partial(np.array(solutions), np.array(rewards), weights)
+		self.results = []
+		self.generation += 1
+		self.batch = []  # candidates not handed out yet are dropped
+		self.batch_index = 0
+		return list(job_ids)
+
+
+class ReuseES:
+	'''Importance-weighted reuse of the evaluations of recent generations for OpenES and PEPG.
+	The search distribution of every generation is a known gaussian, so a solution x sampled from an older
+	one still counts toward the current gradient w/ weight p_now(x) / p_then(x), truncated at max_weight.
+	The update is done by tell_partial on the fresh and the reused solutions, so a smaller popsize gives
+	about the same gradient variance. Keeps generations * popsize solutions on the master.'''
+
+	def __init__(self, es,  # OpenES or PEPG
+				 generations=1,  # number of previous generations reused
+				 max_weight=1.0):  # truncation of the importance weights
+		assert isinstance(es, (OpenES, PEPG)), "only OpenES and PEPG have a gaussian search distribution."
+		self.es = es
+		self.popsize = es.popsize
+		self.generations = generations
+		self.max_weight = max_weight
+		self.history = []  # (solutions, reward, mu, sigma) of previous generations
+		self.effective_size = float(self.popsize)  # effective number of solutions of the last update
+
+	def log_density(self, solutions, mu, sigma):
+		# log of the gaussian density up to a constant that is the same for every generation
+		sigma = np.broadcast_to(sigma, (self.es.num_params,))
+		return - np.sum(np.log(sigma)) - 0.5 * np.sum(np.square((solutions - mu) / sigma), axis=1)
+
+	def ask(self):
+		'''returns a list of parameters'''
+		self.mu = np.copy(self.es.mu)
+		self.sigma = np.copy(self.es.sigma)
+		return self.es.ask()
+
+	def tell(self, reward_table_result):
+		solutions = np.array(self.es.solutions, dtype=np.float64)
+		reward = np.array(reward_table_result, dtype=np.float64)
+		if len(self.history) == 0:
+			self.es.tell(reward)
+		else:
+			old_solutions, old_reward, weights = [solutions], [reward], [np.ones(len(reward))]
+			for x, r, mu, sigma in self.history:
+				log_ratio = self.log_density(x, self.mu, self.sigma) - self.log_density(x, mu, sigma)
+				old_solutions.append(x)
+				old_reward.append(r)
+				weights.append(np.exp(np.minimum(log_ratio, np.log(self.max_weight))))
+			weights = np.concatenate(weights)
+			self.effective_size = float(np.square(np.sum(weights)) / np.sum(np.square(weights)))
+			self.es.tell_partial(np.concatenate(old_solutions), np.concatenate(old_reward), weights)
+		self.history.append((solutions, reward, self.mu, self.sigma))
+		self.history = self.history[-self.generations:]
+
+
+class Surrogate:
+	'''Kernel ridge regression of the fitness on the parameter vectors of the latest evaluations.
+	kernel 'ridge' is linear ridge regression, solved in its dual form since there are fewer samples than
+	parameters, 'rbf' a gaussian kernel w/ the median squared distance of the samples as length scale.'''
+
+	def __init__(self, kernel='ridge',  # 'ridge' or 'rbf'
+				 max_size=1000,  # samples kept, the oldest are dropped first
+				 l2_coeff=1e-2):  # regularization, relative to the mean of the kernel diagonal
+		assert kernel in ('ridge', 'rbf'), kernel
+		self.kernel = kernel
+		self.max_size = max_size
+		self.l2_coeff = l2_coeff
+		self.solutions = None
+		self.fitness = None
+		self.alpha = None
+
+	def size(self):
+		return 0 if self.fitness is None else len(self.fitness)
+
+	def add(self, solutions, fitness):
+		solutions = np.asarray(solutions, dtype=np.float64)
+		fitness = np.asarray(fitness, dtype=np.float64)
+		if self.fitness is not None:
+			solutions = np.concatenate([self.solutions, solutions])
+			fitness = np.concatenate([self.fitness, fitness])
+		self.solutions = solutions[-self.max_size:]
+		self.fitness = fitness[-self.max_size:]
+		self.alpha = None
+
+	def _kernel(self, x):
+		if self.kernel == 'ridge':
+			return np.dot(x - self.center, (self.solutions - self.center).T)
+		sq_dist = (np.sum(np.square(x), axis=1)[:, None] + self.sq_norm[None, :]
+				   - 2 * np.dot(x, self.solutions.T))
+		return np.exp(-np.maximum(sq_dist, 0) / self.length_scale)
+
+	def fit(self):
+		self.center = np.mean(self.solutions, axis=0)
+		self.sq_norm = np.sum(np.square(self.solutions), axis=1)
+		if self.kernel == 'rbf':
+			sq_dist = self.sq_norm[:, None] + self.sq_norm[None, :] - 2 * np.dot(self.solutions, self.solutions.T)
+			self.length_scale = max(np.median(sq_dist[np.triu_indices(len(sq_dist), 1)]), 1e-12)
+		k = self._kernel(self.solutions)
+		self.mean = np.mean(self.fitness)
+		l2 = self.l2_coeff * max(np.mean(np.diag(k)), 1e-12)
+		self.alpha = np.linalg.solve(k + l2 * np.eye(len(k)), self.fitness - self.mean)
+
+	def predict(self, solutions):
+		if self.alpha is None:
+			self.fit()
+		return np.dot(self._kernel(np.asarray(solutions, dtype=np.float64)), self.alpha) + self.mean
+
+
+class SurrogateES:
+	'''Surrogate-assisted evaluation for any of the optimizers above.
+	Once min_size evaluations are known, every generation is oversampled: the optimizer is asked until there are
+	ceil(popsize / keep) candidates, the surrogate ranks them and only the popsize best are evaluated and told,
+	w/ tell_partial where the optimizer has it, else as its solutions. Antithetic pairs of OpenES and PEPG are
+	ranked by their mean prediction and kept or dropped together, so every pair that is told is complete.
+	Before that the popsize candidates of one ask are evaluated. rank_correlation is the Spearman correlation
+	of predicted and real fitness of the last evaluated candidates.'''
+
+	def __init__(self, es, kernel='ridge', keep=0.5, max_size=1000, min_size=None):
+		self.es = es
+		self.popsize = es.popsize
+		self.surrogate = Surrogate(kernel, max_size)
+		self.num_draw = max(int(np.ceil(self.popsize / keep)), self.popsize)
+		self.min_size = self.popsize if min_size is None else min_size
+
+		self.solutions = None  # the popsize candidates to evaluate
+		self.noise_index = None  # and their noise, w/ a noise table
+		self.noise_sign = None
+		self.predicted = None
+		self.rank_correlation = float('nan')
+		self.num_candidates = 0
+		self.num_evaluated = 0
+
+	def groups(self):
+		# group of every solution of one ask of the optimizer, the two halves of an antithetic pair share one
+		index = np.arange(self.popsize)
+		if isinstance(self.es, OpenES) and self.es.antithetic:
+			return index % self.es.half_popsize
+		if isinstance(self.es, PEPG):
+			offset = 0 if self.es.average_baseline else 1  # the mu of PEPG w/o average baseline is a group of its own
+			index[offset:] = offset + (index[offset:] - offset) % self.es.batch_size
+		return index
+
+	def ask(self):
+		'''returns the popsize solutions to evaluate'''
+		self.predicted = None
+		if self.surrogate.size() < self.min_size:
+			self.solutions = np.asarray(self.es.ask())
+			self.noise_index = getattr(self.es, 'noise_index', None)
+			self.noise_sign = getattr(self.es, 'noise_sign', None)
+			self.num_candidates += self.popsize
+			return self.solutions
+
+		# the mu of PEPG w/o average baseline is the same in every ask, only the one of the first ask is kept
+		repeated = 1 if isinstance(self.es, PEPG) and not self.es.average_baseline else 0
+		solutions, noise_index, noise_sign, groups = [], [], [], []
+		i = 0
+		while sum(len(x) for x in solutions) < self.num_draw:
+			rows = slice(repeated if i > 0 else 0, None)
+			solutions.append(np.asarray(self.es.ask())[rows])
+			if getattr(self.es, 'noise_index', None) is not None:
+				noise_index.append(self.es.noise_index[rows])
+				noise_sign.append(self.es.noise_sign[rows])
+			groups.append(self.groups()[rows] + i * self.popsize)
+			i += 1
+		groups = np.concatenate(groups)
+		full_size = np.bincount(groups)
+		solutions = np.concatenate(solutions)[:self.num_draw]
+		groups = groups[:self.num_draw]
+		predicted = self.surrogate.predict(solutions)
+
+		# best groups by mean prediction until popsize solutions. a group that does not fit any more is skipped,
+		# so is a pair cut in half by the num_draw limit
+		group_ids, group_index = np.unique(groups, return_inverse=True)
+		group_size = np.bincount(group_index)
+		group_mean = np.bincount(group_index, weights=predicted) / group_size
+		picked = np.zeros(len(group_ids), dtype=bool)
+		count = 0
+		for g in np.argsort(-group_mean):
+			if group_size[g] == full_size[group_ids[g]] and count + group_size[g] <= self.popsize:
+				picked[g] = True
+				count += group_size[g]
+		assert count == self.popsize, "no complete set of antithetic pairs."
+		index = np.flatnonzero(picked[group_index])
+
+		self.num_candidates += len(solutions)
+		self.solutions = solutions[index]
+		self.predicted = predicted[index]
+		if len(noise_index) > 0:
+			self.noise_index = np.concatenate(noise_index)[:self.num_draw][index]
+			self.noise_sign = np.concatenate(noise_sign)[:self.num_draw][index]
+		return self.solutions
+
+	def tell(self, reward_table_result):
+		'''reward of the solutions returned by ask'''
+		reward = np.asarray(reward_table_result, dtype=np.float64)
+		self.num_evaluated += len(reward)
+		self.surrogate.add(self.solutions, reward)
+		if self.predicted is None:
+			self.es.tell(reward)
+			return
+		self.rank_correlation = float(np.corrcoef(compute_ranks(self.predicted), compute_ranks(reward))[0, 1])
+		if hasattr(self.es, 'tell_partial'):
+			self.es.tell_partial(self.solutions, reward)
+		else:
+			self.es.solutions = self.solutions  # CMA-ES updates from any solutions of its search distribution
+			self.es.tell(reward)
+
+	def savings(self):
+		'''fraction of the candidates so far that were not evaluated'''
+		return 1. - self.num_evaluated / max(self.num_candidates, 1)
+
+
+def benchmark_ga_ask(popsize=256, num_params=867, repeat=20):
+	'''times SimpleGA.ask against the former loop over children.'''
+	import time
+
+	def ask_loop(ga):
+		epsilon = np.random.randn(ga.popsize, ga.num_params) * ga.sigma
+		solutions = []
+		for i in range(ga.popsize):
+			a = ga.elite_params[np.random.choice(range(ga.elite_popsize))]
+			b = ga.elite_params[np.random.choice(range(ga.elite_popsize))]
+			c = np.copy(a)
+			idx = np.where(np.random.rand(c.size) > 0.5)
+			c[idx] = b[idx]
+			solutions.append(c + epsilon[i])
+		return np.array(solutions)
+
+	ga = SimpleGA(num_params, popsize=popsize)
+	ga.elite_params = np.random.randn(ga.elite_popsize, num_params)
+	for name, ask in (('loop', ask_loop), ('batched', SimpleGA.ask)):
+		start = time.time()
+		for i in range(repeat):
+			ask(ga)
+		print('%-8s popsize %d num_params %d: %.2f ms per ask' % (name, popsize, num_params,
+																   (time.time() - start) / repeat * 1000))
+
+
+if __name__ == '__main__':
+	for popsize, num_params in ((64, 867), (256, 867), (1024, 867), (256, 10000)):
+		benchmark_ga_ask(popsize, num_params)
@@ -1,2 +1,2 @@
 #!/usr/bin/env bash
-xvfb-run -a -s "-screen 0 1400x900x24 +extension RANDR" -- python train.py
\ No newline at end of file
+xvfb-run -a -s "-screen 0 1400x900x24 +extension RANDR" -- python train.py --resume 1
\ No newline at end of file
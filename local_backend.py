@@ -0,0 +1,148 @@
+'''
+Single-node stand-in for the part of mpi4py that train.py uses.
+Ranks are processes started by multiprocessing, and messages are copied through
+shared memory slots, so training runs without MPI installed.
+'''
+
+import multiprocessing as mp
+import queue
+import numpy as np
+
+ANY_SOURCE = -1
+ANY_TAG = -1
+COLLECTIVE_TAG = -2  # never matched by ANY_TAG, like collectives never match point to point receives
+
+
+class Status:
+	def __init__(self):
+		self.source = ANY_SOURCE
+		self.tag = ANY_TAG
+		self.count = 0
+
+	def Get_source(self):
+		return self.source
+
+	def Get_tag(self):
+		return self.tag
+
+	def Get_count(self):
+		return self.count
+
+
+class Channel:
+	'''One way shared memory slot between two ranks.
+	A send blocks until the previous message in the slot has been received.'''
+
+	def __init__(self, ctx, slot_size):
+		self.slot_size = slot_size
+		self.slot = ctx.RawArray('B', slot_size)
+		self.free = ctx.Semaphore(1)
+
+	def write(self, buf):
+		assert buf.nbytes <= self.slot_size, "message of " + str(buf.nbytes) + " bytes does not fit the slot"
+		self.free.acquire()
+		data = np.frombuffer(self.slot, dtype=np.uint8)
+		data[:buf.nbytes] = buf.view(np.uint8).reshape(-1)
+
+	def read(self, buf, nbytes):
+		assert buf.nbytes >= nbytes, "receive buffer is too small"
+		data = np.frombuffer(self.slot, dtype=np.uint8, count=nbytes)
+		buf.view(np.uint8).reshape(-1)[:nbytes] = data
+		self.free.release()
+
+
+class LocalComm:
+	'''Communicator of one rank: Send/Recv/Probe/Iprobe/Bcast/Scatter/Gather with the mpi4py buffer signatures.
+	Only the master (rank 0) talks to the workers.'''
+
+	def __init__(self, rank, size, inboxes, channels):
+		self.rank = rank
+		self.size = size
+		self.inboxes = inboxes  # rank -> queue of message headers (source, tag, nbytes)
+		self.channels = channels  # (source, dest) -> Channel
+		self.pending = []  # headers received from the inbox but not matched yet
+
+	def Get_rank(self):
+		return self.rank
+
+	def Get_size(self):
+		return self.size
+
+	def Send(self, buf, dest, tag=0):
+		buf = np.ascontiguousarray(buf)
+		self.channels[(self.rank, dest)].write(buf)
+		self.inboxes[dest].put((self.rank, tag, buf.nbytes))
+
+	def _match(self, source, tag, block=True):
+		while True:
+			for i, (s, t, n) in enumerate(self.pending):
+				if source in (ANY_SOURCE, s) and (tag == t or (tag == ANY_TAG and t >= 0)):
+					return i
+			try:
+				self.pending.append(self.inboxes[self.rank].get(block=block))
+			except queue.Empty:
+				return None
+
+	def _fill(self, status, header):
+		if status is not None:
+			status.source, status.tag, status.count = header
+
+	def Recv(self, buf, source=ANY_SOURCE, tag=ANY_TAG, status=None):
+		header = self.pending.pop(self._match(source, tag))
+		self.channels[(header[0], self.rank)].read(buf, header[2])
+		self._fill(status, header)
+
+	def Probe(self, source=ANY_SOURCE, tag=ANY_TAG, status=None):
+		self._fill(status, self.pending[self._match(source, tag)])
+		return True
+
+	def Iprobe(self, source=ANY_SOURCE, tag=ANY_TAG, status=None):
+		i = self._match(source, tag, block=False)
+		if i is None:
+			return False
+		self._fill(status, self.pending[i])
+		return True
+
+	def Bcast(self, buf, root=0):
+		if self.rank == root:
+			for i in range(self.size):
+				if i != root:
+					self.Send(buf, dest=i, tag=COLLECTIVE_TAG)
+		else:
+			self.Recv(buf, source=root, tag=COLLECTIVE_TAG)
+
+	def Scatter(self, sendbuf, recvbuf, root=0):
+		if self.rank == root:
+			chunks = np.ascontiguousarray(sendbuf).reshape(self.size, -1)
+			for i in range(self.size):
+				if i != root:
+					self.Send(chunks[i], dest=i, tag=COLLECTIVE_TAG)
+			recvbuf[...] = chunks[root].reshape(recvbuf.shape)
+		else:
+			self.Recv(recvbuf, source=root, tag=COLLECTIVE_TAG)
+
+	def Gather(self, sendbuf, recvbuf, root=0):
+		if self.rank == root:
+			chunks = recvbuf.reshape(self.size, -1)  # recvbuf must be contiguous, the rows are received in place
+			for i in range(self.size):
+				if i != root:
+					self.Recv(chunks[i], source=i, tag=COLLECTIVE_TAG)
+			chunks[root] = np.asarray(sendbuf).reshape(-1)
+		else:
+			self.Send(sendbuf, dest=root, tag=COLLECTIVE_TAG)
+
+
+def start(size, target, args=(), slot_size=1 << 20):
+	'''Spawns ranks 1 ... size - 1, each running target(comm, *args), and returns the comm of rank 0.
+	slot_size is the largest message in bytes.'''
+	ctx = mp.get_context('spawn')  # fresh interpreters, nothing of the master's TF session is inherited
+	inboxes = [ctx.Queue() for i in range(size)]
+	channels = {}
+	for i in range(1, size):
+		channels[(0, i)] = Channel(ctx, slot_size)
+		channels[(i, 0)] = Channel(ctx, slot_size)
+	for i in range(1, size):
+		p = ctx.Process(target=target, args=(LocalComm(i, size, inboxes, channels),) + tuple(args))
+		p.daemon = True
+		p.start()
+	return LocalComm(0, size, inboxes, channels)
@@ -1,8 +1,8 @@
 # coding=utf-8
 from model import *
 
-from vae.vae import ConvVAE
-from rnn.rnn import hps_sample, MDNRNN, rnn_init_state, rnn_next_state, rnn_output, rnn_output_size
+from vae.vae import make_vae
+from rnn.rnn import hps_sample, make_rnn, rnn_init_state, rnn_next_state, rnn_output, rnn_output_size
 import mcts
 import numpy as np
 
@@ -42,12 +42,12 @@ def dp(*args: 'iter'):
 
 
 class ModelMCTS(Model):
-	def __init__(self, load_model=True):
+	def __init__(self, load_model=True, numpy_rnn=False, numpy_vae=False):
 		self.env_name = "carracing"
 		self.env = make_env(self.env_name, seed=SEED, render_mode=render_mode, full_episode=False)
-		self.vae = ConvVAE(batch_size=1, gpu_mode=False, is_training=False, reuse=True)
+		self.vae = make_vae(1, numpy_vae)
 
-		self.rnn = MDNRNN(hps_sample, gpu_mode=False, reuse=True)
+		self.rnn = make_rnn(hps_sample, numpy_rnn)
 
 		if load_model:
 			self.vae.load_json('../vae/vae.json')
@@ -73,13 +73,19 @@ class ModelMCTS(Model):
 
 		self.render_mode = False
 		self.mct = None
+		self.budget = mcts.Budget(min_simulations=20, max_simulations=400, episode_cap=100000)
+
+	def reset(self):
+		Model.reset(self)
+		self.budget.reset()
 
 	def get_action(self, z):
 		a = random_linear_sample(-1, 1)
 		b = random_linear_sample(0, 1)
 		c = random_linear_sample(0, 1)
 		actions = dp(a, b, c)
-		action, self.mct = mcts.mcts(z, self.env, actions, old_tree=self.mct, tree_depth=6, simulate_depth=200)
+		action, self.mct, _ = mcts.mcts(z, self.env, actions, old_tree=self.mct, tree_depth=6, simulate_depth=200,
+										budget=self.budget)
 
 		self.state = rnn_next_state(self.rnn, z, action, self.state)
 
@@ -93,4 +99,5 @@ if __name__ == '__main__':
 	for i in range(N_episode):
 		reward, steps_taken = simulate(model, train_mode=False, render_mode=True, num_episode=1)
 		print("terminal reward", reward, "average steps taken", np.mean(steps_taken) + 1)
+		print("simulation budget", model.budget.stats())
 		reward_list.append(reward[0])
@@ -25,6 +25,7 @@ class Node:
 		self.state = None
 		self.env_state = None
 		self.reward = 0
+		self.reward_square = 0
 		self.time = 0
 		self._children = Layer(0, self)
 
@@ -62,13 +63,23 @@ class Node:
 
 	def bp(self, reward):
 		self.reward += reward
+		self.reward_square += reward * reward
 		self.time += 1
 		node = self
 		while node.parent:
 			node = node.parent
 			node.reward += reward
+			node.reward_square += reward * reward
 			node.time += 1
 
+	@property
+	def value(self):
+		return self.reward / self.time
+
+	@property
+	def variance(self):
+		return max(self.reward_square / self.time - self.value ** 2, 0)
+
 	@property
 	def ucb(self):
 		u = self.reward / self.time
@@ -249,7 +260,124 @@ class Tree:
 		self._iter_dfs(self.root, print_node, [max_depth])
 
 
-def mcts(state, env_state, actions, old_tree=None, tree_depth=10, simulate_depth=30, simulate_frequency=5):
+class Budget:
+	"""
+	Adaptive simulation budget of the MCTS.
+	The search of a step stops early when the best child of the root is statistically separated
+	from the second best one, and goes on beyond the tree depth while the decision is close.
+	The simulations spent in one episode are capped.
+	"""
+
+	def __init__(self, min_simulations: 'int>=0' = 20, max_simulations: 'int>0' = 1000,
+				 episode_cap: 'int>0' = None, confidence: 'float>0' = 2.0, min_visits: 'int>=2' = 5):
+		"""
+		:param min_simulations: the simulations of a step before the early stop is considered
+		:param max_simulations: the max simulations of a step, including the extension
+		:param episode_cap: the max simulations of an episode, None for no cap
+		:param confidence: the width of the confidence bound on the value gap, in standard errors
+		:param min_visits: the visits of each of the two best children before their variances are trusted
+		"""
+		assert min_visits >= 2, 'a child visited once has no variance'
+		self.min_simulations = min_simulations
+		self.max_simulations = max_simulations
+		self.episode_cap = episode_cap
+		self.confidence = confidence
+		self.min_visits = min_visits
+		self.spent = 0
+		self.steps = []
+		self._reason = None
+		self._depth_reached = None
+
+	def reset(self):
+		"""
+		Start a new episode: the spent budget and the statistics are cleared.
+		:return: None
+		"""
+		self.spent = 0
+		self.steps = []
+
+	@property
+	def remaining(self):
+		if self.episode_cap is None:
+			return self.max_simulations
+		return max(self.episode_cap - self.spent, 0)
+
+	def separated(self, root: 'Node'):
+		"""
+		Check if the best child of the root is separated from the second best one,
+		i.e. the gap of their values exceeds the confidence bound of the gap.
+		Both need min_visits visits, w/ fewer the variance (0 after one visit) makes the bound meaningless.
+		:param root: the root of the MCT
+		:return: True if separated, else False
+		"""
+		children = [child for child in root.children or [] if child.time > 0]
+		if len(children) < 2:
+			return False
+		children.sort(key=lambda child: child.value, reverse=True)
+		best, second = children[0], children[1]
+		if min(best.time, second.time) < self.min_visits:
+			return False
+		bound = self.confidence * sqrt(best.variance / best.time + second.variance / second.time)
+		return best.value - second.value > bound
+
+	def proceed(self, mct: 'Tree', tree_depth: 'int>=0', simulations: 'int>=0'):
+		"""
+		Decide if the search of the current step goes on.
+		:param mct: the MCT under search
+		:param tree_depth: the depth of the MCT where a fixed budget search would stop
+		:param simulations: the simulations spent in the current step
+		:return: True if the search goes on, else False
+		"""
+		if simulations == 0:
+			self._reason = None
+			self._depth_reached = None
+		if simulations >= min(self.max_simulations, self.remaining):
+			self._reason = 'cap'
+			return False
+		if not mct.root.children:
+			return True  # nothing to choose from yet
+		if simulations >= self.min_simulations and self.separated(mct.root):
+			self._reason = 'separated'
+			return False
+		if self._depth_reached is None and mct.depth > tree_depth:
+			self._depth_reached = simulations
+		return True
+
+	def record(self, simulations: 'int>=0', elapsed_time: 'float>=0'):
+		"""
+		Record the budget spent in one step.
+		:param simulations: the simulations spent in the step
+		:param elapsed_time: the time spent in the step
+		:return: None
+		"""
+		extended = 0
+		if self._depth_reached is not None:
+			extended = simulations - self._depth_reached
+		self.spent += simulations
+		self.steps.append((simulations, extended, elapsed_time, self._reason))
+
+	def stats(self):
+		"""
+		Get the statistics of the budget spent in the current episode.
+		:return: a dict of the statistics
+		"""
+		n = len(self.steps)
+		simulations = [step[0] for step in self.steps]
+		return {
+			'steps': n,
+			'simulations': self.spent,
+			'mean_simulations': self.spent / n if n else 0,
+			'max_simulations': max(simulations) if n else 0,
+			'separated': sum(1 for step in self.steps if step[3] == 'separated'),
+			'capped': sum(1 for step in self.steps if step[3] == 'cap'),
+			'extended': sum(1 for step in self.steps if step[1] > 0),
+			'extended_simulations': sum(step[1] for step in self.steps),
+			'time': sum(step[2] for step in self.steps),
+		}
+
+
+def mcts(state, env_state, actions, old_tree=None, tree_depth=10, simulate_depth=30, simulate_frequency=5,
+		 budget=None):
 	"""
 	MCTS algorithm
 	:param state: root state
@@ -259,6 +387,7 @@ def mcts(state, env_state, actions, old_tree=None, tree_depth=10, simulate_depth
 	:param tree_depth: the max depth of the MCT
 	:param simulate_depth: the depth of simulation
 	:param simulate_frequency: the number of simulations during one expanded node
+	:param budget: the adaptive Budget of the simulations, None for a search bounded by tree_depth only
 	:return: best action
 	"""
 	time_start = time.time()
@@ -270,14 +399,27 @@ def mcts(state, env_state, actions, old_tree=None, tree_depth=10, simulate_depth
 		mct = Tree(actions, simulate_depth=simulate_depth)
 	mct.root.state = state
 	mct.root.env_state = copy.deepcopy(env_state)
-	while mct.depth <= tree_depth:
+	simulations = 0
+	while budget.proceed(mct, tree_depth, simulations) if budget else mct.depth <= tree_depth:
 		node = mct.expand(mct.select())
 		for i in range(simulate_frequency):
 			mct.simulate(node)
+		simulations += simulate_frequency
+	if budget and not any(child.time > 0 for child in mct.root.children or []):
+		# the episode cap was spent before this step, act at random and start over w/ a new tree
+		time_end = time.time()
+		budget.record(simulations, time_end - time_start)
+		return random.choice(list(mct.actions)), None, time_end - time_start
 	mct.print(max_depth=2)
-	result = max(mct.root.children, key=lambda child: child.ucb)
+	if budget:
+		# the child the separation test ranks first, w/o the exploration bonus of ucb
+		result = max((child for child in mct.root.children if child.time > 0), key=lambda child: child.value)
+	else:
+		result = max(mct.root.children, key=lambda child: child.ucb)
 	mct.set_root(result)
 	time_end = time.time()
+	if budget:
+		budget.record(simulations, time_end - time_start)
 	return mct.actions[result.index], mct, time_end - time_start
 
 
@@ -294,6 +436,7 @@ def test():
 	recording_obs = []
 	recording_reward = []
 	recording_time = []
+	budget = Budget(min_simulations=20, max_simulations=400)
 	env.render()
 	print('Reward:', reward)
 	while not done:
@@ -301,7 +444,8 @@ def test():
 										  old_tree=tree,
 										  tree_depth=6,
 										  simulate_depth=200,
-										  simulate_frequency=20)
+										  simulate_frequency=20,
+										  budget=budget)
 		obs, reward, done, info = env.step(action)
 		recording_obs.append(obs)
 		recording_reward.append(reward)
@@ -311,6 +455,7 @@ def test():
 		print('Reward:', reward)
 	print(recording_obs)
 	print(recording_reward)
+	print('budget:', budget.stats())
 
 
 if __name__ == '__main__':
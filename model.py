@@ -7,8 +7,8 @@ import sys
 from env import make_env
 import time
 
-from vae.vae import ConvVAE
-from rnn.rnn import hps_sample, MDNRNN, rnn_init_state, rnn_next_state, rnn_output, rnn_output_size
+from vae.vae import make_vae
+from rnn.rnn import hps_sample, make_rnn, rnn_init_state, rnn_next_state, rnn_output, rnn_output_batch, rnn_output_size
 
 render_mode = True
 
@@ -22,9 +22,14 @@ MODE_ZH = 4
 EXP_MODE = MODE_ZH
 
 
-def make_model(load_model=True):
+def make_model(load_model=True, numpy_rnn=False, numpy_vae=False):
 	# can be extended in the future.
-	model = Model(load_model=load_model)
+	model = Model(load_model=load_model, numpy_rnn=numpy_rnn, numpy_vae=numpy_vae)
+	return model
+
+
+def make_batch_model(batch_size, load_model=True, numpy_rnn=False, numpy_vae=False):
+	model = BatchModel(batch_size, load_model=load_model, numpy_rnn=numpy_rnn, numpy_vae=numpy_vae)
 	return model
 
 
@@ -56,11 +61,11 @@ def sample(p):
 class Model:
 	''' simple one layer model for car racing '''
 
-	def __init__(self, load_model=True):
+	def __init__(self, load_model=True, numpy_rnn=False, numpy_vae=False):
 		self.env_name = "carracing"
-		self.vae = ConvVAE(batch_size=1, gpu_mode=False, is_training=False, reuse=True)
+		self.vae = make_vae(1, numpy_vae)  # numpy_vae: NumpyConvVAE encoder w/o a TF graph
 
-		self.rnn = MDNRNN(hps_sample, gpu_mode=False, reuse=True)
+		self.rnn = make_rnn(hps_sample, numpy_rnn)  # numpy_rnn: NumpyMDNRNN w/o a TF session run per step
 
 		if load_model:
 			self.vae.load_json('vae/vae.json')
@@ -161,7 +166,236 @@ class Model:
 		self.rnn.set_model_params(rnn_params)
 
 
-def simulate(model, train_mode=False, render_mode=True, num_episode=5, seed=-1, max_len=-1):
+class BatchModel:
+	''' batch_size copies of Model that run in lockstep, one environment per lane.
+	every step encodes the frames of all lanes in one VAE call, advances all LSTM states in one RNN call
+	and applies the controller of every lane in one einsum. '''
+
+	def __init__(self, batch_size, load_model=True, numpy_rnn=False, numpy_vae=False):
+		self.env_name = "carracing"
+		self.batch_size = batch_size
+		self.vae = make_vae(batch_size, numpy_vae)
+
+		self.rnn = make_rnn(hps_sample._replace(batch_size=batch_size), numpy_rnn)
+
+		if load_model:
+			self.vae.load_json('vae/vae.json')
+			self.rnn.load_json('rnn/rnn.json')
+
+		self.state = rnn_init_state(self.rnn)
+
+		self.input_size = rnn_output_size(EXP_MODE)
+		self.z_size = 32
+
+		if EXP_MODE == MODE_Z_HIDDEN:  # one hidden layer
+			self.hidden_size = 40
+			self.param_count = ((self.input_size + 1) * self.hidden_size) + (self.hidden_size * 3 + 3)
+		else:
+			self.param_count = (self.input_size) * 3 + 3
+		self.set_model_params(np.zeros((self.batch_size, self.param_count)))
+
+		self.envs = []
+
+	def make_env(self, seed=-1, render_mode=False, full_episode=False):
+		self.envs = [make_env(self.env_name, seed=seed, render_mode=render_mode, full_episode=full_episode)
+					 for i in range(self.batch_size)]
+
+	def reset(self):
+		self.state = rnn_init_state(self.rnn)
+
+	def encode_obs(self, obs):
+		# convert a batch of raw obs to z, mu, logvar
+		result = obs.astype(np.float32) / 255.0
+		mu, logvar = self.vae.encode_mu_logvar(result)
+		z = mu + np.exp(logvar / 2.0) * np.random.randn(*logvar.shape)
+		return z, mu, logvar
+
+	def get_action(self, z):
+		h = rnn_output_batch(self.state, z, EXP_MODE)
+
+		if EXP_MODE == MODE_Z_HIDDEN:  # one hidden layer
+			h = np.tanh(np.einsum('ki,kij->kj', h, self.weight_hidden) + self.bias_hidden)
+			action = np.tanh(np.einsum('ki,kij->kj', h, self.weight_output) + self.bias_output)
+		else:
+			action = np.tanh(np.einsum('ki,kij->kj', h, self.weight) + self.bias)
+
+		action[:, 1] = (action[:, 1] + 1.0) / 2.0
+		action[:, 2] = clip(action[:, 2])
+
+		self.state = rnn_next_state(self.rnn, z, action, self.state)
+
+		return action
+
+	def set_model_params(self, model_params):
+		# one row of parameters per lane, in the layout of Model.set_model_params
+		params = np.array(model_params).reshape(self.batch_size, self.param_count)
+		if EXP_MODE == MODE_Z_HIDDEN:  # one hidden layer
+			cut_off = (self.input_size + 1) * self.hidden_size
+			self.bias_hidden = params[:, :self.hidden_size]
+			self.weight_hidden = params[:, self.hidden_size:cut_off].reshape(self.batch_size, self.input_size,
+																			 self.hidden_size)
+			self.bias_output = params[:, cut_off:cut_off + 3]
+			self.weight_output = params[:, cut_off + 3:].reshape(self.batch_size, self.hidden_size, 3)
+		else:
+			self.bias = params[:, :3]
+			self.weight = params[:, 3:].reshape(self.batch_size, self.input_size, 3)
+
+
+def new_timing():
+	# seconds spent in the env (step and render), the vae and the controller (rnn and policy), and env steps
+	return {'env': 0., 'encode': 0., 'control': 0., 'steps': 0}
+
+
+class EarlyStop:
+	'''
+	early termination of training episodes that are going nowhere, checked once per time step.
+	window: stop when the cumulative reward has not reached a new high for window steps (0 disables).
+	min_reward_rate: stop when, after grace steps, the cumulative reward is below min_reward_rate per step
+	taken (None disables). the master derives it from a low quantile of the reward per step of the population.
+	a stopped episode is charged the reward of the steps up to max_len it does not play (see unplayed_reward),
+	so cutting a hopeless episode short does not rank it above a weak one played to the end.
+	truncated counts the stopped episodes, stopped flags them per lane since the last reset.
+	'''
+
+	step_reward = -0.1  # what every CarRacing frame costs
+
+	def __init__(self, window=0, min_reward_rate=None, grace=100):
+		self.window = window
+		self.min_reward_rate = min_reward_rate
+		self.grace = grace
+		self.truncated = 0
+		self.reset()
+
+	def enabled(self):
+		return self.window > 0 or self.min_reward_rate is not None
+
+	def reset(self, num_lanes=1):
+		self.best = np.full(num_lanes, -np.inf)
+		self.best_t = np.zeros(num_lanes, dtype=np.int64)
+		self.stopped = np.zeros(num_lanes, dtype=bool)
+
+	def check(self, t, total_reward, lanes=None):
+		'''total_reward of every lane after step t, returns which of the given lanes stop.'''
+		if lanes is None:
+			lanes = np.arange(len(self.best))
+		reward = np.asarray(total_reward, dtype=np.float64)[lanes]
+		improved = reward > self.best[lanes]
+		self.best[lanes] = np.where(improved, reward, self.best[lanes])
+		self.best_t[lanes] = np.where(improved, t, self.best_t[lanes])
+		stop = np.zeros(len(lanes), dtype=bool)
+		if self.window > 0:
+			stop |= (t - self.best_t[lanes]) >= self.window
+		if self.min_reward_rate is not None and t >= self.grace:
+			stop |= reward < self.min_reward_rate * (t + 1)
+		self.stopped[lanes] |= stop
+		self.truncated += int(np.sum(stop))
+		return stop
+
+	def unplayed_reward(self, t, max_len):
+		'''reward charged to an episode stopped after step t (a number or an array) for the max_len - t - 1 steps
+		it does not play: step_reward per step, or min_reward_rate if that is lower.'''
+		rate = self.step_reward
+		if self.min_reward_rate is not None:
+			rate = min(rate, self.min_reward_rate)
+		return rate * (max_len - np.asarray(t) - 1)
+
+
+def simulate_batch(model, model_params_list, train_mode=False, num_episode=5, seeds=None, max_len=-1,
+				   early_stop=None, timing=None):
+	'''
+	num_episode episodes of every parameter vector in model_params_list, all run in lockstep on a BatchModel
+	with at least len(model_params_list) * num_episode lanes. lanes whose episode is done are masked out.
+	returns a list of rewards and a list of time steps per parameter vector, like simulate does for one.
+	episode e of the vector with seed s is played on a track seeded with s + e.
+	in train mode, lanes stopped by early_stop (an EarlyStop) are masked out like finished ones and charged
+	for the steps they do not play, early_stop.stopped then flags them per lane. timing (see new_timing) is added to if given.
+	'''
+	n = len(model_params_list)
+	num_lanes = n * num_episode
+	assert num_lanes <= model.batch_size, "batch model has too few lanes"
+
+	max_episode_length = 1000
+	if train_mode and max_len > 0:
+		max_episode_length = max_len
+	if not train_mode:
+		early_stop = None
+	if early_stop is not None:
+		early_stop.reset(model.batch_size)
+
+	if seeds is not None and seeds[0] >= 0:
+		random.seed(seeds[0])
+		np.random.seed(seeds[0])
+
+	# lane i plays episode i % num_episode of vector i // num_episode, spare lanes copy vector 0 and never run
+	lane_params = [model_params_list[i // num_episode] if i < num_lanes else model_params_list[0]
+				   for i in range(model.batch_size)]
+	model.set_model_params(lane_params)
+	model.reset()
+
+	obs = np.zeros((model.batch_size, 64, 64, 3), dtype=np.uint8)
+	alive = np.zeros(model.batch_size, dtype=bool)
+	alive[:num_lanes] = True
+	for i in range(num_lanes):
+		if seeds is not None and seeds[i // num_episode] >= 0:
+			model.envs[i].seed(int(seeds[i // num_episode]) + i % num_episode)
+		obs[i] = model.envs[i].reset()
+
+	total_reward = np.zeros(model.batch_size)
+	t_list = np.zeros(model.batch_size, dtype=np.int64)
+	z = np.zeros((model.batch_size, model.z_size))
+
+	env_time = encode_time = control_time = 0.
+	num_steps = 0
+	for t in range(max_episode_length):
+		lanes = np.flatnonzero(alive)
+		t0 = time.time()
+		for i in lanes:
+			model.envs[i].render('rgb_array')
+		t1 = time.time()
+
+		z[lanes] = model.encode_obs(obs[lanes])[0]  # the rnn needs every lane, the vae only the live ones
+		t2 = time.time()
+		action = model.get_action(z)
+		t3 = time.time()
+
+		for i in lanes:
+			obs[i], reward, done, info = model.envs[i].step(action[i])
+			total_reward[i] += reward
+			t_list[i] = t
+			if done:
+				alive[i] = False
+		env_time += (t1 - t0) + (time.time() - t3)
+		encode_time += t2 - t1
+		control_time += t3 - t2
+		num_steps += len(lanes)
+
+		if early_stop is not None:
+			lanes = lanes[alive[lanes]]  # episodes that ended on their own are not truncated
+			alive[lanes[early_stop.check(t, total_reward, lanes)]] = False
+
+		if not alive.any():
+			break
+
+	if early_stop is not None:
+		stopped = early_stop.stopped
+		total_reward[stopped] += early_stop.unplayed_reward(t_list[stopped], max_episode_length)
+
+	if timing is not None:
+		timing['env'] += env_time
+		timing['encode'] += encode_time
+		timing['control'] += control_time
+		timing['steps'] += num_steps
+
+	reward_list = total_reward[:num_lanes].reshape(n, num_episode).tolist()
+	t_list = t_list[:num_lanes].reshape(n, num_episode).tolist()
+	return reward_list, t_list
+
+
+def simulate(model, train_mode=False, render_mode=True, num_episode=5, seed=-1, max_len=-1, early_stop=None,
+			 timing=None):
+	# early_stop: an EarlyStop applied in train mode, its truncated count goes up for every episode it ends,
+	# which is charged for the steps it does not play
+	# timing: a dict from new_timing, the time spent per part of a step is added to it
 	reward_list = []
 	t_list = []
 
@@ -171,6 +405,8 @@ def simulate(model, train_mode=False, render_mode=True, num_episode=5, seed=-1,
 
 	if train_mode and max_len > 0:
 		max_episode_length = max_len
+	if not train_mode:
+		early_stop = None
 
 	if (seed >= 0):
 		random.seed(seed)
@@ -180,6 +416,8 @@ def simulate(model, train_mode=False, render_mode=True, num_episode=5, seed=-1,
 	for episode in range(num_episode):
 
 		model.reset()
+		if early_stop is not None:
+			early_stop.reset()
 
 		obs = model.env.reset()
 
@@ -193,21 +431,30 @@ def simulate(model, train_mode=False, render_mode=True, num_episode=5, seed=-1,
 		recording_action = []
 		recording_reward = [0]
 
+		env_time = encode_time = control_time = 0.
+
 		for t in range(max_episode_length):
 
+			t0 = time.time()
 			if render_mode:
 				model.env.render("human")
 			else:
 				model.env.render('rgb_array')
+			t1 = time.time()
 
 			z, mu, logvar = model.encode_obs(obs)
+			t2 = time.time()
 			action = model.get_action(z)
+			t3 = time.time()
 
 			recording_mu.append(mu)
 			recording_logvar.append(logvar)
 			recording_action.append(action)
 
 			obs, reward, done, info = model.env.step(action)
+			env_time += (t1 - t0) + (time.time() - t3)
+			encode_time += t2 - t1
+			control_time += t3 - t2
 
 			extra_reward = 0.0  # penalize for turning too frequently
 			if train_mode and penalize_turning:
@@ -223,6 +470,15 @@ def simulate(model, train_mode=False, render_mode=True, num_episode=5, seed=-1,
 
 			if done:
 				break
+			if early_stop is not None and early_stop.check(t, [total_reward])[0]:
+				total_reward += early_stop.unplayed_reward(t, max_episode_length)
+				break
+
+		if timing is not None:
+			timing['env'] += env_time
+			timing['encode'] += encode_time
+			timing['control'] += control_time
+			timing['steps'] += t + 1
 
 		# for recording:
 		z, mu, logvar = model.encode_obs(obs)
@@ -0,0 +1,149 @@
+'''
+Inference of the MDN-RNN of rnn.py in NumPy, w/ the weights of the same rnn.json.
+A step of the LSTM is two matrix products for the whole batch, no TF session run per frame.
+python -m rnn.numpy_rnn from the repository root times a step and checks it against MDNRNN (needs TensorFlow).
+'''
+
+import json
+import time
+import numpy as np
+from collections import namedtuple
+
+LSTMStateTuple = namedtuple('LSTMStateTuple', ('c', 'h'))  # same fields as the state of the TF cell
+
+
+def sigmoid(x):
+	return 0.5 * (np.tanh(0.5 * x) + 1.0)  # no overflow for large negative x
+
+
+class NumpyMDNRNN:
+	'''The inference part of MDNRNN: hps, load_json / set_model_params and the rnn_* functions of rnn.py.
+	The cell is LayerNormBasicLSTMCell as in hps_sample: no layer norm, no dropout, forget bias 1.
+	States are LSTMStateTuple of float32 arrays of shape (batch_size, rnn_size).'''
+
+	param_names = ['output_w', 'output_b', 'kernel', 'bias']  # the trainable variables of MDNRNN, in its order
+
+	def __init__(self, hps):
+		assert hps.use_layer_norm == 0, "layer norm is not implemented"
+		self.hps = hps
+		self.num_mixture = hps.num_mixture
+		self.forget_bias = 1.0
+		num_units = hps.rnn_size
+		self.output_w = np.zeros((num_units, hps.output_seq_width * hps.num_mixture * 3), dtype=np.float32)
+		self.output_b = np.zeros(hps.output_seq_width * hps.num_mixture * 3, dtype=np.float32)
+		self.kernel = np.zeros((hps.input_seq_width + num_units, 4 * num_units), dtype=np.float32)
+		self.bias = np.zeros(4 * num_units, dtype=np.float32)
+		self.split_kernel()
+
+	def split_kernel(self):
+		# the cell multiplies [inputs, h] by the kernel, two products save the concatenation
+		self.kernel_x = np.ascontiguousarray(self.kernel[:self.hps.input_seq_width])
+		self.kernel_h = np.ascontiguousarray(self.kernel[self.hps.input_seq_width:])
+
+	def get_model_params(self):
+		model_params = [np.round(getattr(self, name) * 10000).astype(int).tolist() for name in self.param_names]
+		model_shapes = [getattr(self, name).shape for name in self.param_names]
+		return model_params, model_shapes, self.param_names
+
+	def set_model_params(self, params):
+		for name, p in zip(self.param_names, params):
+			p = np.array(p)
+			assert getattr(self, name).shape == p.shape, "inconsistent shape"
+			setattr(self, name, (p.astype(float) / 10000.).astype(np.float32))
+		self.split_kernel()
+
+	def load_json(self, jsonfile='rnn.json'):
+		with open(jsonfile, 'r') as f:
+			params = json.load(f)
+		self.set_model_params(params)
+
+	def zero_state(self, batch_size=None):
+		if batch_size is None:
+			batch_size = self.hps.batch_size
+		zeros = np.zeros((batch_size, self.hps.rnn_size), dtype=np.float32)
+		return LSTMStateTuple(zeros, np.copy(zeros))
+
+	def next_state(self, input_x, state):
+		# input_x is (batch_size, input_seq_width): z and action
+		gates = np.dot(input_x.astype(np.float32), self.kernel_x)
+		gates += np.dot(state.h, self.kernel_h)
+		gates += self.bias
+		i, j, f, o = np.split(gates, 4, axis=1)
+		c = state.c * sigmoid(f + self.forget_bias) + sigmoid(i) * np.tanh(j)
+		h = np.tanh(c) * sigmoid(o)
+		return LSTMStateTuple(c, h)
+
+	def mixture(self, h):
+		# logmix, mean, logstd of the next z, (batch_size * output_seq_width, num_mixture) each like out_* of MDNRNN
+		output = (np.dot(h, self.output_w) + self.output_b).reshape(-1, self.num_mixture * 3)
+		logmix, mean, logstd = np.split(output, 3, axis=1)
+		max_logmix = np.max(logmix, axis=1, keepdims=True)
+		logmix = logmix - (max_logmix + np.log(np.sum(np.exp(logmix - max_logmix), axis=1, keepdims=True)))
+		return logmix, mean, logstd
+
+
+def sample_hps(batch_size=1):
+	# hps_sample of rnn.py w/ another batch size
+	from rnn.rnn import hps_sample
+	return hps_sample._replace(batch_size=batch_size)
+
+
+def check(jsonfile='rnn/rnn.json', batch_size=4, steps=200, seed=0):
+	'''Max absolute difference of the states and mixtures of NumpyMDNRNN and MDNRNN over steps random inputs.'''
+	from rnn.rnn import MDNRNN
+	hps = sample_hps(batch_size)
+	tf_rnn = MDNRNN(hps, gpu_mode=False, reuse=True)
+	tf_rnn.load_json(jsonfile)
+	np_rnn = NumpyMDNRNN(hps)
+	np_rnn.load_json(jsonfile)
+
+	rs = np.random.RandomState(seed)
+	tf_state = tf_rnn.sess.run(tf_rnn.initial_state)
+	np_state = np_rnn.zero_state()
+	diff = {'c': 0., 'h': 0., 'logmix': 0., 'mean': 0., 'logstd': 0.}
+	for t in range(steps):
+		input_x = np.concatenate([rs.randn(batch_size, 32), rs.uniform(0, 1, (batch_size, 3))], axis=1)
+		feed = {tf_rnn.input_x: input_x.reshape(batch_size, 1, -1), tf_rnn.initial_state: tf_state}
+		logmix, mean, logstd, tf_state = tf_rnn.sess.run(
+			[tf_rnn.out_logmix, tf_rnn.out_mean, tf_rnn.out_logstd, tf_rnn.final_state], feed)
+		np_state = np_rnn.next_state(input_x, np_state)
+		np_logmix, np_mean, np_logstd = np_rnn.mixture(np_state.h)
+		for name, a, b in (('c', tf_state.c, np_state.c), ('h', tf_state.h, np_state.h), ('logmix', logmix, np_logmix),
+						   ('mean', mean, np_mean), ('logstd', logstd, np_logstd)):
+			diff[name] = max(diff[name], float(np.max(np.abs(a - b))))
+		np_state = LSTMStateTuple(tf_state.c, tf_state.h)  # no drift, every step starts from the same state
+	return diff
+
+
+def benchmark(jsonfile='rnn/rnn.json', batch_sizes=(1, 16), steps=2000):
+	'''Seconds per step of next_state and mixture for each batch size.'''
+	result = {}
+	for batch_size in batch_sizes:
+		rnn = NumpyMDNRNN(sample_hps(batch_size))
+		rnn.load_json(jsonfile)
+		state = rnn.zero_state()
+		input_x = np.random.randn(batch_size, rnn.hps.input_seq_width).astype(np.float32)
+		start_time = time.time()
+		for t in range(steps):
+			state = rnn.next_state(input_x, state)
+		step_time = (time.time() - start_time) / steps
+		start_time = time.time()
+		for t in range(steps):
+			rnn.mixture(state.h)
+		result[batch_size] = (step_time, (time.time() - start_time) / steps)
+	return result
+
+
+if __name__ == '__main__':
+	for batch_size, (step_time, mixture_time) in benchmark().items():
+		print("batch size", batch_size, "next state", round(step_time * 1e6, 1), "us",
+			  "mixture", round(mixture_time * 1e6, 1), "us")
+	try:
+		import tensorflow
+	except ImportError:
+		tensorflow = None
+		print("no TensorFlow, not checked against MDNRNN")
+	if tensorflow is not None:
+		diff = check()
+		print("max abs difference to MDNRNN", diff)
+		assert max(diff.values()) < 1e-4, "NumpyMDNRNN does not match MDNRNN"
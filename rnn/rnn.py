@@ -1,7 +1,17 @@
 import numpy as np
 from collections import namedtuple
 import json
-import tensorflow as tf
+from rnn.numpy_rnn import NumpyMDNRNN
+
+tf = None  # TensorFlow, imported by the first MDNRNN so that NumpyMDNRNN runs w/o it
+
+
+def import_tf():
+	global tf
+	if tf is None:
+		import tensorflow
+		tf = tensorflow
+	return tf
 
 # hyperparameters for our model. I was using an older tf version, when HParams was not available ...
 
@@ -63,6 +73,7 @@ hps_sample = hps_model._replace(batch_size=1, max_seq_len=1, use_recurrent_dropo
 # MDN-RNN model
 class MDNRNN():
 	def __init__(self, hps, gpu_mode=True, reuse=False):
+		import_tf()
 		self.hps = hps
 		with tf.variable_scope('mdn_rnn', reuse=reuse):
 			if not gpu_mode:
@@ -305,16 +316,39 @@ def sample_sequence(sess, s_model, hps, init_z, actions, temperature=1.0, seq_le
 	return strokes
 
 
+def make_rnn(hps, numpy_rnn=False):
+	# MDNRNN on the cpu for inference, or NumpyMDNRNN that steps w/o TensorFlow, which is then never imported
+	if numpy_rnn:
+		return NumpyMDNRNN(hps)
+	return MDNRNN(hps, gpu_mode=False, reuse=True)
+
+
 def rnn_init_state(rnn):
+	if isinstance(rnn, NumpyMDNRNN):
+		return rnn.zero_state()
 	return rnn.sess.run(rnn.initial_state)
 
 
 def rnn_next_state(rnn, z, a, prev_state):
-	input_x = np.concatenate((z.reshape((1, 1, 32)), a.reshape((1, 1, 3))), axis=2)
-	feed = {rnn.input_x: input_x, rnn.initial_state: prev_state}
+	# z and a are one row per batch entry of the rnn (or flat for batch size 1)
+	input_x = np.concatenate((z.reshape((-1, 32)), a.reshape((-1, 3))), axis=1)
+	if isinstance(rnn, NumpyMDNRNN):
+		return rnn.next_state(input_x, prev_state)
+	feed = {rnn.input_x: input_x.reshape((-1, 1, 35)), rnn.initial_state: prev_state}
 	return rnn.sess.run(rnn.final_state, feed)
 
 
+def rnn_next_mixture(rnn, z, a, prev_state):
+	# rnn_next_state and the mixture of the next z: logmix, mean, logstd of shape (batch size * 32, num_mixture)
+	input_x = np.concatenate((z.reshape((-1, 32)), a.reshape((-1, 3))), axis=1)
+	if isinstance(rnn, NumpyMDNRNN):
+		next_state = rnn.next_state(input_x, prev_state)
+		logmix, mean, logstd = rnn.mixture(next_state.h)
+		return logmix, mean, logstd, next_state
+	feed = {rnn.input_x: input_x.reshape((-1, 1, 35)), rnn.initial_state: prev_state}
+	return rnn.sess.run([rnn.out_logmix, rnn.out_mean, rnn.out_logstd, rnn.final_state], feed)
+
+
 def rnn_output_size(mode):
 	if mode == MODE_ZCH:
 		return (32 + 256 + 256)
@@ -331,3 +365,14 @@ def rnn_output(state, z, mode):
 	if mode == MODE_ZH:
 		return np.concatenate([z, state.h[0]])
 	return z  # MODE_Z or MODE_Z_HIDDEN
+
+
+def rnn_output_batch(state, z, mode):
+	# rnn_output for every batch entry, z is (batch_size, 32)
+	if mode == MODE_ZCH:
+		return np.concatenate([z, state.c, state.h], axis=1)
+	if mode == MODE_ZC:
+		return np.concatenate([z, state.c], axis=1)
+	if mode == MODE_ZH:
+		return np.concatenate([z, state.h], axis=1)
+	return z  # MODE_Z or MODE_Z_HIDDEN
@@ -0,0 +1,76 @@
+'''
+NumpyMDNRNN against a direct implementation of the TF cell it replaces, and against MDNRNN if TensorFlow is installed.
+Run w/ python -m pytest from the repository root.
+'''
+
+import json
+import os
+import sys
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from rnn.numpy_rnn import NumpyMDNRNN, LSTMStateTuple, sample_hps, check
+
+RNN_JSON = os.path.join(ROOT, 'rnn', 'rnn.json')
+
+
+def reference_step(kernel, bias, output_w, output_b, num_mixture, x, c, h):
+	# LayerNormBasicLSTMCell w/o layer norm and dropout: [x, h] times the whole kernel, gates i, j, f, o,
+	# forget bias 1, then the MDN head of MDNRNN w/ logmix normalized by logsumexp, all in float64
+	gates = np.dot(np.concatenate([x, h], axis=1), kernel) + bias
+	i, j, f, o = np.split(gates, 4, axis=1)
+	c = c / (1 + np.exp(-(f + 1.0))) + np.tanh(j) / (1 + np.exp(-i))
+	h = np.tanh(c) / (1 + np.exp(-o))
+	output = (np.dot(h, output_w) + output_b).reshape(-1, num_mixture * 3)
+	logmix, mean, logstd = np.split(output, 3, axis=1)
+	logmix = logmix - np.log(np.sum(np.exp(logmix), axis=1, keepdims=True))
+	return c, h, logmix, mean, logstd
+
+
+def test_load_json():
+	rnn = NumpyMDNRNN(sample_hps())
+	rnn.load_json(RNN_JSON)
+	with open(RNN_JSON, 'r') as f:
+		params = json.load(f)
+	model_params, model_shapes, names = rnn.get_model_params()
+	assert model_params == params
+	assert rnn.kernel.dtype == np.float32
+
+
+def test_matches_reference():
+	batch_size = 4
+	rnn = NumpyMDNRNN(sample_hps(batch_size))
+	rnn.load_json(RNN_JSON)
+	weights = [p.astype(np.float64) for p in (rnn.kernel, rnn.bias, rnn.output_w, rnn.output_b)]
+	rs = np.random.RandomState(0)
+	state = rnn.zero_state()
+	c, h = np.zeros((batch_size, rnn.hps.rnn_size)), np.zeros((batch_size, rnn.hps.rnn_size))
+	for t in range(50):
+		x = np.concatenate([rs.randn(batch_size, 32), rs.uniform(0, 1, (batch_size, 3))], axis=1)
+		state = rnn.next_state(x, state)
+		logmix, mean, logstd = rnn.mixture(state.h)
+		c, h, ref_logmix, ref_mean, ref_logstd = reference_step(*weights, rnn.num_mixture, x, c, h)
+		for a, b in ((state.c, c), (state.h, h), (logmix, ref_logmix), (mean, ref_mean), (logstd, ref_logstd)):
+			assert a.shape == b.shape
+			assert np.max(np.abs(a - b)) < 1e-4
+		state = LSTMStateTuple(c.astype(np.float32), h.astype(np.float32))  # no float32 drift between the two
+
+
+def test_batch_rows_are_independent():
+	rnn = NumpyMDNRNN(sample_hps(3))
+	rnn.load_json(RNN_JSON)
+	x = np.random.RandomState(1).randn(3, rnn.hps.input_seq_width)
+	state = rnn.next_state(x, rnn.zero_state())
+	single = NumpyMDNRNN(sample_hps(1))
+	single.load_json(RNN_JSON)
+	state_1 = single.next_state(x[1:2], single.zero_state())
+	assert np.max(np.abs(state.h[1:2] - state_1.h)) < 1e-6
+
+
+def test_matches_mdnrnn():
+	pytest.importorskip('tensorflow')
+	diff = check(jsonfile=RNN_JSON)
+	assert max(diff.values()) < 1e-4, diff
@@ -0,0 +1,75 @@
+'''
+NumpyConvVAE against a direct implementation of the TF encoder it replaces, and against ConvVAE if TensorFlow is installed.
+Run w/ python -m pytest from the repository root.
+'''
+
+import os
+import sys
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from vae.numpy_vae import NumpyConvVAE, check
+
+
+def reference_conv(x, w, b, stride=2):
+	# tf.layers.conv2d w/ 'valid' padding and relu, one output pixel at a time, in float64
+	n, height, width, _ = x.shape
+	kernel_size = w.shape[0]
+	out_height = (height - kernel_size) // stride + 1
+	out_width = (width - kernel_size) // stride + 1
+	out = np.zeros((n, out_height, out_width, w.shape[3]))
+	for r in range(out_height):
+		for c in range(out_width):
+			patch = x[:, r * stride:r * stride + kernel_size, c * stride:c * stride + kernel_size, :]
+			out[:, r, c, :] = np.tensordot(patch, w, axes=([1, 2, 3], [0, 1, 2])) + b
+	return np.maximum(out, 0)
+
+
+def reference_encode(vae, x):
+	h = x.astype(np.float64)
+	for i in range(1, 5):
+		h = reference_conv(h, getattr(vae, 'conv%d_w' % i).astype(np.float64), getattr(vae, 'conv%d_b' % i))
+	h = h.reshape(h.shape[0], -1)
+	return np.dot(h, vae.mu_w) + vae.mu_b, np.dot(h, vae.logvar_w) + vae.logvar_b
+
+
+def random_vae(seed=0):
+	np.random.seed(seed)
+	vae = NumpyConvVAE()
+	vae.set_random_params(stdev=0.01)
+	return vae
+
+
+def test_params_round_trip():
+	vae = random_vae()
+	params, shapes, names = vae.get_model_params()
+	other = NumpyConvVAE()
+	other.set_model_params(params)
+	assert other.get_model_params() == (params, shapes, names)
+
+
+def test_matches_reference():
+	vae = random_vae()
+	x = np.random.RandomState(1).rand(3, 64, 64, 3).astype(np.float32)
+	mu, logvar = vae.encode_mu_logvar(x)
+	ref_mu, ref_logvar = reference_encode(vae, x)
+	assert mu.shape == (3, vae.z_size) and logvar.shape == (3, vae.z_size)
+	assert np.max(np.abs(mu - ref_mu)) < 1e-3 * max(1.0, np.max(np.abs(ref_mu)))
+	assert np.max(np.abs(logvar - ref_logvar)) < 1e-3 * max(1.0, np.max(np.abs(ref_logvar)))
+
+
+def test_batch_rows_are_independent():
+	vae = random_vae()
+	x = np.random.RandomState(2).rand(4, 64, 64, 3).astype(np.float32)
+	mu, _ = vae.encode_mu_logvar(x)
+	mu_1, _ = vae.encode_mu_logvar(x[2:3])
+	assert np.max(np.abs(mu[2:3] - mu_1)) < 1e-4 * max(1.0, np.max(np.abs(mu_1)))
+
+
+def test_matches_convvae():
+	pytest.importorskip('tensorflow')
+	diff = check(jsonfile=os.path.join(ROOT, 'vae', 'vae.json'))
+	assert max(diff.values()) < 1e-3, diff
@@ -12,14 +12,26 @@ robo_walker
 robo_humanoid
 '''
 
-from mpi4py import MPI
+try:
+	from mpi4py import MPI
+except ImportError:
+	MPI = None  # only the local backend is available
 import numpy as np
 import json
 import os
+import hashlib
+import socket
+from collections import OrderedDict
 import subprocess
 import sys
-from model import make_model, simulate
-from es import CMAES, SimpleGA, OpenES, PEPG
+import threading
+import queue
+import traceback
+from model import make_model, make_batch_model, simulate, simulate_batch, EarlyStop, new_timing
+from dream_model import make_model as make_dream_model, simulate as simulate_dream
+from es import CMAES, SepCMAES, SimpleGA, OpenES, PEPG, SharedNoiseTable, AsyncES, SurrogateES, ReuseES
+import local_backend
+from train_log import LogWriter
 import argparse
 import time
 
@@ -33,6 +45,16 @@ num_worker = 8
 num_worker_trial = 1
 
 population = num_worker * num_worker_trial
+population_size = -1  # -1 means num_worker * num_worker_trial
+
+# 'static': worker k always gets the k-th slice of the population
+# 'queue': single jobs are handed out to whichever worker is free
+dispatch_mode = 'static'
+
+# asynchronous steady-state ES: update once a quorum of the population has been evaluated (0 disables)
+async_quorum = 0
+max_staleness = 2
+staleness_decay = 0.5
 
 gamename = 'carracing'
 optimizer = 'pepg'
@@ -42,33 +64,137 @@ batch_mode = 'mean'
 # seed for reproducibility
 seed_start = 0
 
+# checkpoint of the optimizer, seeder and run every N generations (0 disables), --resume continues from it
+checkpoint_steps = 25
+resume_mode = False
+
+# shared noise table: packets carry offsets into the table instead of parameters
+noise_table_mode = False
+noise_table_size = 10000000
+noise_seed = 123
+noise_table = None
+noise_theta = None  # mu and sigma, broadcast once per generation
+
+# float32 solutions on the master, the optimizer regenerates the noise from per-row seeds instead of keeping it
+low_memory = False
+
 ### name of the file (can override):
 filebase = None
 
 model = None
 num_params = -1
 
+# early termination of training episodes (see model.EarlyStop): stop after stop_window steps w/o a new reward high,
+# or after stop_grace steps below the reward per step of the stop_quantile of the previous generation (0 disables)
+stop_window = 0
+stop_quantile = 0
+stop_grace = 100
+
+# racing: a job is num_episode episodes, a candidate gets up to race_jobs of them in rounds of doubling size,
+# only while its mean is within race_z standard errors of the top race_elite cut (race_jobs <= 1 disables)
+race_jobs = 0
+race_elite = 0.25
+race_z = 1.0
+
+# multi-fidelity: every candidate first runs dream_episode episodes in the dream env (MDN-RNN, no Box2D),
+# only the best dream_screen fraction goes on to the real env (0 disables)
+dream_screen = 0
+dream_episode = 4
+dream = None
+
+# surrogate-assisted ES: popsize / surrogate_keep candidates are sampled and a 'ridge' or 'rbf' fitness predictor
+# picks the popsize of them that get evaluated ('' disables)
+surrogate = ''
+surrogate_keep = 0.5
+
+# importance-weighted reuse of the evaluations of the last reuse_generations generations (0 disables)
+reuse_generations = 0
+
+# fault tolerance: a job that raises on a worker is run once more w/ a new env, then reported as failed,
+# the master hands failed jobs out again up to job_retries times. w/ queue dispatch, a worker holding a job longer
+# than job_timeout seconds is taken out until it answers and the job goes to another worker (0 waits forever)
+job_retries = 2
+job_timeout = 0
+lost_workers = set()
+
+# w/ queue dispatch, the master runs jobs too: one at a time in a background thread, only when no worker is free
+master_eval = False
+master_worker = None
+job_queue = None  # queue dispatch: the JobQueue of the master
+
+# several ES runs sharing the workers, (optimizer, seed) per run, each stops after sweep_generations generations
+sweep_runs = []
+sweep_generations = 100
+sweep_es = []
+
+# per rank throughput and time breakdown per generation, written to filebase.telemetry.jsonl
+# a rank is flagged as a straggler below straggler_ratio times the median env steps per second
+straggler_ratio = 0.5
+telemetry = None
+
+# fitness of finished jobs keyed on the parameters, seed, max_len, train mode and reward bound, 0 entries disables
+cache_size = 0
+result_cache = None
+
+# workers run all episodes of all solutions of a packet in lockstep on one BatchModel
+batch_eval = False
+batch_model = None
+
+# step the MDN-RNN w/ rnn.numpy_rnn instead of a TF session run per frame
+numpy_rnn = False
+# encode frames w/ the encoder of vae.numpy_vae instead of a ConvVAE graph per worker
+numpy_vae = False
+
 es = None
 
 ### MPI related code
-comm = MPI.COMM_WORLD
-rank = comm.Get_rank()
+# 'mpi': ranks launched by mpirun, 'local': worker processes on this machine talking through shared memory
+backend = 'mpi'
+comm = None
+rank = 0
+if MPI is not None:
+	comm = MPI.COMM_WORLD
+	rank = comm.Get_rank()
 
 PRECISION = 10000
-SOLUTION_PACKET_SIZE = (5 + num_params) * num_worker_trial
-RESULT_PACKET_SIZE = 4 * num_worker_trial
+JOB_SIZE = 6 + num_params
+TIMING_FIELDS = ['seconds', 'env', 'encode', 'control', 'steps']  # seconds of a job on the worker, env steps
+RESULT_SIZE = 5 + len(TIMING_FIELDS)  # worker, job, fitness, time steps, truncated episodes, timing
+SOLUTION_PACKET_SIZE = JOB_SIZE * num_worker_trial
+RESULT_PACKET_SIZE = RESULT_SIZE * num_worker_trial
+THETA_TAG = 1
+HOST_TAG = 2  # host name of a worker, sent once at start
+STOP_TAG = 3  # the master is done, the worker returns
+JOB_TAG = 16  # queue dispatch: first tag of the jobs and results of a batch, above the other tags
+JOB_FAILED = -1  # truncated episodes of a job that raised on the worker
+SKIP_JOB = -1  # train mode of a job whose result the master already has
+DREAM_JOB = 2  # train mode of a job run in the dream env
+NO_REWARD_BOUND = -2 ** 31  # reward bound of a job that is not stopped for falling behind
+
+# 'p2p': int32 packets quantized by PRECISION, sent to and received from one rank at a time
+# 'collective': float32 jobs and float64 results moved by one Scatter / Gather per generation
+transport = 'p2p'
+solution_buffer = None  # master: one row of jobs per rank, row 0 is unused
+result_buffer = None  # master: one row of results per rank, row 0 is unused
+packet_buffer = None
+result_packet_buffer = None
+
+# collective transport over two levels: the lowest rank of each node is a sub-master that scatters the jobs of its
+# node and gathers its results over a node communicator, only the sub-masters exchange messages w/ the root
+hierarchy = False
+node_comm = None
+leader_comm = None  # root and sub-masters, None on the other ranks
+node_order = None  # root: world ranks grouped by node, in the order of leader_comm
+node_counts = None  # root: ranks per node
+node_solution_buffer = None  # root: solution_buffer in node order, sub-masters: jobs of the node
+node_result_buffer = None  # root: result_buffer in node order, sub-masters: results of the node
 
 
 ###
 
-def initialize_settings(sigma_init=0.1, sigma_decay=0.9999):
-	global population, filebase, game, model, num_params, es, PRECISION, SOLUTION_PACKET_SIZE, RESULT_PACKET_SIZE
-	population = num_worker * num_worker_trial
-	filebase = 'log/' + gamename + '.' + optimizer + '.' + str(num_episode) + '.' + str(population)
-	model = make_model()
-	num_params = model.param_count
-	print("size of model", num_params)
-
+def make_es(optimizer, sigma_init, sigma_decay, seed):
+	# every run has its own RandomState, shared by its optimizer and its Seeder
+	rng = np.random.RandomState(seed)
 	if optimizer == 'ses':
 		ses = PEPG(num_params,
 				   sigma_init=sigma_init,
@@ -77,7 +203,10 @@ def initialize_settings(sigma_init=0.1, sigma_decay=0.9999):
 				   sigma_limit=0.02,
 				   elite_ratio=0.1,
 				   weight_decay=0.005,
-				   popsize=population)
+				   popsize=population,
+				   noise_table=noise_table,
+				   low_memory=low_memory,
+				   rng=rng)
 		es = ses
 	elif optimizer == 'ga':
 		ga = SimpleGA(num_params,
@@ -86,13 +215,21 @@ def initialize_settings(sigma_init=0.1, sigma_decay=0.9999):
 					  sigma_limit=0.02,
 					  elite_ratio=0.1,
 					  weight_decay=0.005,
-					  popsize=population)
+					  popsize=population,
+					  rng=rng)
 		es = ga
 	elif optimizer == 'cma':
 		cma = CMAES(num_params,
 					sigma_init=sigma_init,
-					popsize=population)
+					popsize=population,
+					rng=rng)
 		es = cma
+	elif optimizer == 'sepcma':
+		sepcma = SepCMAES(num_params,
+						  sigma_init=sigma_init,
+						  popsize=population,
+					  rng=rng)
+		es = sepcma
 	elif optimizer == 'pepg':
 		pepg = PEPG(num_params,
 					sigma_init=sigma_init,
@@ -103,7 +240,10 @@ def initialize_settings(sigma_init=0.1, sigma_decay=0.9999):
 					learning_rate_decay=1.0,
 					learning_rate_limit=0.01,
 					weight_decay=0.005,
-					popsize=population)
+					popsize=population,
+					noise_table=noise_table,
+					low_memory=low_memory,
+					rng=rng)
 		es = pepg
 	else:
 		oes = OpenES(num_params,
@@ -115,12 +255,57 @@ def initialize_settings(sigma_init=0.1, sigma_decay=0.9999):
 					 learning_rate_limit=0.01,
 					 antithetic=antithetic,
 					 weight_decay=0.005,
-					 popsize=population)
+					 popsize=population,
+					 noise_table=noise_table,
+					 low_memory=low_memory,
+					 rng=rng)
 		es = oes
+	return es
+
+
+def initialize_settings(sigma_init=0.1, sigma_decay=0.9999):
+	global population, filebase, game, model, num_params, es, PRECISION, SOLUTION_PACKET_SIZE, RESULT_PACKET_SIZE
+	global noise_table, noise_theta, JOB_SIZE, sweep_es
+	global solution_buffer, result_buffer, packet_buffer, result_packet_buffer
+	global node_solution_buffer, node_result_buffer
+	population = num_worker * num_worker_trial
+	if population_size > 0:
+		assert dispatch_mode == 'queue', "population must be num_worker * num_worker_trial w/ static dispatch."
+		population = population_size
+	filebase = 'log/' + gamename + '.' + optimizer + '.' + str(num_episode) + '.' + str(population)
+	model = make_model(numpy_rnn=numpy_rnn, numpy_vae=numpy_vae)
+	num_params = model.param_count
+	print("size of model", num_params)
+
+	if noise_table_mode:
+		assert optimizer in ('ses', 'pepg', 'openes'), "noise table only works w/ ses, pepg, openes."
+		noise_table = SharedNoiseTable(noise_table_size, noise_seed)
+		noise_theta = np.zeros(2 * num_params)
+
+	es = make_es(optimizer, sigma_init, sigma_decay, seed_start)
+	sweep_es = [make_es(name, sigma_init, sigma_decay, seed) for name, seed in sweep_runs]
 
 	PRECISION = 10000
-	SOLUTION_PACKET_SIZE = (5 + num_params) * num_worker_trial
-	RESULT_PACKET_SIZE = 4 * num_worker_trial
+	JOB_SIZE = 6 + num_params
+	if noise_table_mode:
+		JOB_SIZE = 8
+	SOLUTION_PACKET_SIZE = JOB_SIZE * num_worker_trial
+	RESULT_PACKET_SIZE = RESULT_SIZE * num_worker_trial
+	if dispatch_mode == 'queue':
+		# one job per packet
+		SOLUTION_PACKET_SIZE = JOB_SIZE
+		RESULT_PACKET_SIZE = RESULT_SIZE
+
+	if transport == 'collective':
+		# allocated once, every generation is copied into the same buffers
+		solution_buffer = np.zeros((num_worker + 1, SOLUTION_PACKET_SIZE), dtype=np.float32)
+		result_buffer = np.zeros((num_worker + 1, RESULT_PACKET_SIZE), dtype=np.float64)
+		packet_buffer = np.zeros(SOLUTION_PACKET_SIZE, dtype=np.float32)
+		result_packet_buffer = np.zeros(RESULT_PACKET_SIZE, dtype=np.float64)
+	if hierarchy and leader_comm is not None:
+		num_ranks = num_worker + 1 if rank == 0 else node_comm.Get_size()
+		node_solution_buffer = np.zeros((num_ranks, SOLUTION_PACKET_SIZE), dtype=np.float32)
+		node_result_buffer = np.zeros((num_ranks, RESULT_PACKET_SIZE), dtype=np.float64)
 
 
 ###
@@ -146,101 +331,553 @@ class OldSeeder:
 
 
 class Seeder:
-	def __init__(self, init_seed=0):
-		np.random.seed(init_seed)
+	'''Episode seeds of a run, drawn from the RandomState the optimizer of the run samples from (es.rng),
+	so the runs of a sweep do not share np.random.'''
+
+	def __init__(self, rng):
+		self.rng = rng
 		self.limit = np.int32(2 ** 31 - 1)
 
 	def next_seed(self):
-		result = np.random.randint(self.limit)
+		result = self.rng.randint(self.limit)
 		return result
 
 	def next_batch(self, batch_size):
-		result = np.random.randint(self.limit, size=batch_size).tolist()
+		result = self.rng.randint(self.limit, size=batch_size).tolist()
 		return result
 
-
-def encode_solution_packets(seeds, solutions, train_mode=1, max_len=-1):
+	def get_state(self):
+		# the optimizer samples from the same RandomState, so this restores both
+		name, keys, pos, has_gauss, cached_gaussian = self.rng.get_state()
+		return {'keys': keys, 'pos': np.asarray(pos), 'has_gauss': np.asarray(has_gauss),
+				'cached_gaussian': np.asarray(cached_gaussian)}
+
+	def set_state(self, state):
+		self.rng.set_state(('MT19937', state['keys'], int(state['pos']), int(state['has_gauss']),
+							float(state['cached_gaussian'])))
+
+
+class ResultCache:
+	'''Fitness, time steps and truncated episodes of finished evaluation jobs, keyed on a hash of the parameters,
+	seed, max_len, train mode and reward bound.
+	Beyond max_size entries the least recently used ones are dropped. Saved with the checkpoints.'''
+
+	KEY_SIZE = 20  # bytes of a sha1 digest
+
+	def __init__(self, filename, max_size, context=''):
+		self.filename = filename
+		self.max_size = max_size
+		self.context = context.encode()  # settings that change the fitness of the same job
+		self.entries = OrderedDict()
+		self.hits = 0
+		self.misses = 0
+
+	def key(self, params_bytes, seed, max_len, train_mode, reward_bound):
+		h = hashlib.sha1(self.context)
+		h.update(params_bytes)
+		h.update(np.array([seed, max_len, train_mode, reward_bound], dtype=np.int64).tobytes())
+		return h.digest()
+
+	def get(self, key):
+		value = self.entries.get(key)
+		if value is None:
+			self.misses += 1
+			return None
+		self.hits += 1
+		self.entries.move_to_end(key)
+		return value
+
+	def put(self, key, value):
+		self.entries[key] = value
+		self.entries.move_to_end(key)
+		while len(self.entries) > self.max_size:
+			self.entries.popitem(last=False)
+
+	def save(self):
+		keys = np.frombuffer(b''.join(self.entries.keys()), dtype=np.uint8).reshape(len(self.entries), self.KEY_SIZE)
+		values = np.array(list(self.entries.values())).reshape(len(self.entries), RESULT_SIZE - 2)
+		tmp = self.filename + '.tmp'
+		with open(tmp, 'wb') as f:
+			np.savez(f, keys=keys, values=values)
+		os.replace(tmp, self.filename)
+
+	def load(self):
+		if not os.path.exists(self.filename):
+			return
+		with np.load(self.filename) as data:
+			for key, value in zip(data['keys'], data['values']):
+				self.put(key.tobytes(), value)
+
+
+class Telemetry:
+	'''Per generation time breakdown on the master and env steps per second of every rank.
+	total is the wall time of the generation, wait the part the master spent blocked on results, master the rest,
+	compute the mean busy time of a worker. A rank whose steps per second over the last window generations
+	fall below straggler_ratio times the median of the ranks is flagged as a straggler.'''
+
+	def __init__(self, filename, log, hosts, window=5):
+		self.filename = filename
+		self.log = log
+		self.hosts = hosts  # host name per rank
+		self.window = window
+		self.history = [[] for i in range(num_worker + 1)]  # env steps per second per generation, per rank
+		self.start_generation()
+
+	def start_generation(self):
+		self.start_time = time.time()
+		self.wait = 0.
+		self.timing = np.zeros((num_worker + 1, len(TIMING_FIELDS)))  # summed over the jobs of each rank
+
+	def add(self, rank, timing):
+		self.timing[rank] += timing
+
+	def end_generation(self, t):
+		total = time.time() - self.start_time
+		seconds = self.timing[1:, 0]
+		steps = self.timing[1:, 4]
+		steps_per_sec = [None] * num_worker
+		for i in np.flatnonzero(seconds > 0):
+			steps_per_sec[i] = round(steps[i] / seconds[i], 2)
+			self.history[i + 1] = (self.history[i + 1] + [steps_per_sec[i]])[-self.window:]
+		ranks = [i for i in range(1, num_worker + 1) if len(self.history[i]) > 0]
+		rates = [np.mean(self.history[i]) for i in ranks]
+		stragglers = []
+		if len(ranks) > 0:
+			median = np.median(rates)
+			stragglers = [i for i, rate in zip(ranks, rates) if rate < straggler_ratio * median]
+
+		record = {'t': t, 'total': round(total, 4), 'wait': round(self.wait, 4),
+				  'master': round(total - self.wait, 4), 'compute': round(float(np.mean(seconds)), 4)}
+		for j, name in enumerate(TIMING_FIELDS[1:4]):
+			record[name] = round(float(np.mean(self.timing[1:, j + 1])), 4)
+		if master_worker is not None:
+			record['master_compute'] = round(float(self.timing[0, 0]), 4)
+		record['steps'] = int(np.sum(self.timing[:, 4]))  # the master's own jobs included
+		record['steps_per_sec'] = steps_per_sec
+		record['stragglers'] = stragglers
+		self.log.append(self.filename, record)
+
+		sprint("time", "total", record['total'], "compute", record['compute'], "wait", record['wait'],
+			   "master", record['master'], "steps per sec", int(record['steps'] / max(total, 1e-6)))
+		if len(stragglers) > 0:
+			sprint("stragglers", [(i, self.hosts[i], round(float(np.mean(self.history[i])), 2)) for i in stragglers],
+				   "median steps per sec", round(float(median), 2))
+		self.start_generation()
+
+
+def receive_result(result_packet, source, status=None):
+	# blocking receive of a result on the master, the time spent waiting goes to the telemetry
+	start_time = time.time()
+	comm.Recv(result_packet, source=source, status=status)
+	if telemetry is not None:
+		telemetry.wait += time.time() - start_time
+
+
+def add_timing(rank, result):
+	if telemetry is not None:
+		telemetry.add(rank, result[5:])
+
+
+def encode_reward_bound(min_reward_rate):
+	if min_reward_rate is None:
+		return NO_REWARD_BOUND
+	return int(np.round(min_reward_rate * PRECISION))
+
+
+def decode_reward_bound(reward_bound):
+	if reward_bound == NO_REWARD_BOUND:
+		return None
+	return reward_bound / float(PRECISION)
+
+
+def encode_solution_jobs(seeds, solutions, train_mode=1, max_len=-1, min_reward_rate=None):
+	# one row per job, the worker number is filled in when the job is dispatched
 	n = len(seeds)
+	reward_bound = encode_reward_bound(min_reward_rate)
+	if transport == 'collective':
+		# parameters as float32, the integer header is stored bit for bit through an int32 view
+		result = np.empty((n, JOB_SIZE), dtype=np.float32)
+		result[:, 6:] = solutions
+		header = result.view(np.int32)
+		header[:, 0] = 0
+		header[:, 1] = np.arange(n)
+		header[:, 2] = seeds
+		header[:, 3] = train_mode
+		header[:, 4] = max_len
+		header[:, 5] = reward_bound
+		return result
 	result = []
-	worker_num = 0
 	for i in range(n):
-		worker_num = int(i / num_worker_trial) + 1
-		result.append([worker_num, i, seeds[i], train_mode, max_len])
+		result.append([0, i, seeds[i], train_mode, max_len, reward_bound])
 		result.append(np.round(np.array(solutions[i]) * PRECISION, 0))
 	result = np.concatenate(result).astype(np.int32)
-	result = np.split(result, num_worker)
+	return result.reshape(n, JOB_SIZE)
+
+
+def encode_noise_jobs(seeds, noise_index, noise_sign, train_mode=1, max_len=-1, min_reward_rate=None):
+	n = len(seeds)
+	reward_bound = encode_reward_bound(min_reward_rate)
+	result = []
+	for i in range(n):
+		result.append([0, i, seeds[i], train_mode, max_len, reward_bound, noise_index[i], noise_sign[i]])
+	result = np.array(result).astype(np.int32).reshape(n, JOB_SIZE)
+	if transport == 'collective':
+		return result.view(np.float32)  # all integers, reinterpreted
 	return result
 
 
+def split_jobs(jobs):
+	# static dispatch: worker k gets trials (k - 1) * num_worker_trial ... k * num_worker_trial - 1
+	n = len(jobs)
+	header = jobs.view(np.int32)
+	for i in range(n):
+		header[i, 0] = int(i / num_worker_trial) + 1
+	return np.split(jobs.flatten(), num_worker)
+
+
+def encode_solution_packets(seeds, solutions, train_mode=1, max_len=-1):
+	return split_jobs(encode_solution_jobs(seeds, solutions, train_mode, max_len))
+
+
 def decode_solution_packet(packet):
-	packets = np.split(packet, num_worker_trial)
+	packets = np.split(packet, len(packet) // JOB_SIZE)
+	result = []
+	for p in packets:
+		if transport == 'collective':
+			h = p.view(np.int32)
+			result.append([h[0], h[1], h[2], h[3], h[4], h[5], p[6:].astype(np.float64)])
+		else:
+			result.append([p[0], p[1], p[2], p[3], p[4], p[5], p[6:].astype(np.float64) / PRECISION])
+	return result
+
+
+def decode_noise_packet(packet):
+	packets = np.split(packet, len(packet) // JOB_SIZE)
+	mu = noise_theta[:num_params]
+	sigma = noise_theta[num_params:]
 	result = []
 	for p in packets:
-		result.append([p[0], p[1], p[2], p[3], p[4], p[5:].astype(np.float) / PRECISION])
+		p = p.view(np.int32)
+		if p[6] < 0:
+			weights = np.copy(mu)
+		else:
+			weights = mu + p[7] * (noise_table.get(p[6], num_params) * sigma)
+		result.append([p[0], p[1], p[2], p[3], p[4], p[5], weights])
 	return result
 
 
+def broadcast_theta(mu=None, sigma=None):
+	# static dispatch: every rank calls this before every round of packets, once per generation and per retry
+	# queue dispatch: the master sends theta to every worker ahead of the jobs of the generation
+	if rank == 0:
+		noise_theta[:num_params] = mu
+		noise_theta[num_params:] = sigma
+		if dispatch_mode == 'queue':
+			for i in range(1, num_worker + 1):
+				if i not in lost_workers:  # sent when it is back
+					comm.Send(noise_theta, dest=i, tag=THETA_TAG)
+			return
+	comm.Bcast(noise_theta, root=0)
+
+
+def split_nodes():
+	# every rank calls this once. the lowest rank of a node is its sub-master, the root is the sub-master of its node
+	global node_comm, leader_comm, node_order, node_counts
+	node_comm = comm.Split_type(MPI.COMM_TYPE_SHARED, key=rank)
+	is_leader = node_comm.Get_rank() == 0
+	leader_comm = comm.Split(0 if is_leader else MPI.UNDEFINED, key=rank)
+	members = node_comm.gather(rank, root=0)  # world ranks of the node in node rank order
+	if not is_leader:
+		leader_comm = None
+		return
+	members = leader_comm.gather(members, root=0)
+	if rank == 0:
+		node_order = np.concatenate(members)
+		node_counts = np.array([len(m) for m in members])
+		sprint("nodes", len(members), "ranks per node", node_counts.tolist())
+
+
+def scatter_packets():
+	# collective transport: solution_buffer on the root to packet_buffer on every rank
+	if not hierarchy:
+		comm.Scatter(solution_buffer, packet_buffer, root=0)
+		return
+	if leader_comm is not None:
+		if rank == 0:
+			np.take(solution_buffer, node_order, axis=0, out=node_solution_buffer)
+			counts = node_counts * SOLUTION_PACKET_SIZE
+			# the jobs of the root's node come first and stay in place
+			leader_comm.Scatterv([node_solution_buffer, counts, np.cumsum(counts) - counts, MPI.FLOAT],
+								 MPI.IN_PLACE, root=0)
+		else:
+			leader_comm.Scatterv(None, node_solution_buffer, root=0)
+		node_comm.Scatter(node_solution_buffer[:node_comm.Get_size()], packet_buffer, root=0)
+	else:
+		node_comm.Scatter(None, packet_buffer, root=0)
+
+
+def gather_packets():
+	# collective transport: result_packet_buffer of every rank to result_buffer on the root
+	if not hierarchy:
+		comm.Gather(result_packet_buffer, result_buffer, root=0)
+		return
+	if leader_comm is None:
+		node_comm.Gather(result_packet_buffer, None, root=0)
+		return
+	node_comm.Gather(result_packet_buffer, node_result_buffer[:node_comm.Get_size()], root=0)
+	if rank == 0:
+		counts = node_counts * RESULT_PACKET_SIZE
+		leader_comm.Gatherv(MPI.IN_PLACE, [node_result_buffer, counts, np.cumsum(counts) - counts, MPI.DOUBLE], root=0)
+		result_buffer[node_order] = node_result_buffer
+	else:
+		leader_comm.Gatherv(node_result_buffer, None, root=0)
+
+
 def encode_result_packet(results):
-	r = np.array(results)
+	if transport == 'collective':
+		return np.array(results, dtype=np.float64).flatten()
+	r = np.array(results, dtype=np.float64)
 	r[:, 2:4] *= PRECISION
+	r[:, 5:9] *= PRECISION  # seconds
 	return r.flatten().astype(np.int32)
 
 
 def decode_result_packet(packet):
-	r = packet.reshape(num_worker_trial, 4)
-	workers = r[:, 0].tolist()
-	jobs = r[:, 1].tolist()
-	fits = r[:, 2].astype(np.float) / PRECISION
-	fits = fits.tolist()
-	times = r[:, 3].astype(np.float) / PRECISION
-	times = times.tolist()
+	# rows of worker, job, fitness, time steps, truncated episodes and the TIMING_FIELDS
+	r = packet.reshape(-1, RESULT_SIZE).astype(np.float64)
+	if transport != 'collective':
+		r[:, 2:4] /= PRECISION
+		r[:, 5:9] /= PRECISION
 	result = []
-	n = len(jobs)
-	for i in range(n):
-		result.append([workers[i], jobs[i], fits[i], times[i]])
+	for row in r:
+		result.append([int(row[0]), int(row[1])] + row[2:].tolist())
 	return result
 
 
-def worker(weights, seed, train_mode_int=1, max_len=-1):
+def timing_row(start_time, timing, num_jobs=1):
+	# TIMING_FIELDS of one of num_jobs jobs that were run together
+	seconds = time.time() - start_time
+	return [x / num_jobs for x in [seconds, timing['env'], timing['encode'], timing['control'], timing['steps']]]
+
+
+def send_host():
+	name = socket.gethostname().encode()[:64]
+	comm.Send(np.frombuffer(name.ljust(64, b'\0'), dtype=np.uint8).copy(), dest=0, tag=HOST_TAG)
+
+
+def receive_hosts():
+	hosts = [socket.gethostname()]
+	name = np.zeros(64, dtype=np.uint8)
+	for i in range(1, num_worker + 1):
+		comm.Recv(name, source=i, tag=HOST_TAG)
+		hosts.append(name.tobytes().rstrip(b'\0').decode())
+	return hosts
+
+
+def make_early_stop(reward_bound):
+	early_stop = EarlyStop(window=stop_window, min_reward_rate=decode_reward_bound(reward_bound), grace=stop_grace)
+	if early_stop.enabled():
+		return early_stop
+	return None
+
+
+def worker(weights, seed, train_mode_int=1, max_len=-1, reward_bound=NO_REWARD_BOUND):
+	start_time = time.time()
+	timing = new_timing()
 	train_mode = (train_mode_int == 1)
 	model.set_model_params(weights)
+	early_stop = make_early_stop(reward_bound)
 	reward_list, t_list = simulate(model,
 								   train_mode=train_mode, render_mode=False, num_episode=num_episode, seed=seed,
-								   max_len=max_len)
+								   max_len=max_len, early_stop=early_stop, timing=timing)
 	if batch_mode == 'min':
 		reward = np.min(reward_list)
 	else:
 		reward = np.mean(reward_list)
 	t = np.mean(t_list)
-	return reward, t
+	truncated = 0
+	if early_stop is not None:
+		truncated = early_stop.truncated
+	return reward, t, truncated, timing_row(start_time, timing)
+
+
+def dream_worker(weights, seed, max_len=-1):
+	start_time = time.time()
+	dream.set_model_params(weights)
+	reward_list, t_list = simulate_dream(dream, train_mode=True, render_mode=False, num_episode=dream_episode,
+										 seed=seed, max_len=max_len)
+	if batch_mode == 'min':
+		reward = np.min(reward_list)
+	else:
+		reward = np.mean(reward_list)
+	t = np.mean(t_list)
+	timing = new_timing()
+	timing['steps'] = np.sum(t_list) + len(t_list)
+	return reward, t, timing_row(start_time, timing)
+
+
+def worker_batch(solutions):
+	# all solutions of a packet share train mode, max_len and reward bound, they come from the same generation
+	train_mode_int, max_len, reward_bound = solutions[0][3], solutions[0][4], solutions[0][5]
+	for solution in solutions:
+		assert solution[3:6] == [train_mode_int, max_len, reward_bound], "mixed jobs in one packet"
+	start_time = time.time()
+	timing = new_timing()
+	early_stop = make_early_stop(reward_bound)
+	reward_list, t_list = simulate_batch(batch_model, [solution[6] for solution in solutions],
+										 train_mode=(train_mode_int == 1), num_episode=num_episode,
+										 seeds=[int(solution[2]) for solution in solutions], max_len=int(max_len),
+										 early_stop=early_stop, timing=timing)
+	if batch_mode == 'min':
+		reward = np.min(reward_list, axis=1)
+	else:
+		reward = np.mean(reward_list, axis=1)
+	t = np.mean(t_list, axis=1)
+	truncated = np.zeros(len(solutions), dtype=np.int64)
+	if early_stop is not None:
+		truncated = early_stop.stopped[:len(solutions) * num_episode].reshape(len(solutions), num_episode).sum(axis=1)
+	# the jobs ran in lockstep, each gets an equal share of the time
+	timing_rows = [timing_row(start_time, timing, len(solutions)) for solution in solutions]
+	return reward, t, truncated, timing_rows
+
+
+def close_env(env):
+	try:
+		env.close()
+	except Exception:
+		pass  # it is replaced anyway
+
+
+def recreate_env():
+	# after an exception the env may be in any state, e.g. a Box2D world half torn down
+	if batch_eval:
+		for env in batch_model.envs:
+			close_env(env)
+		batch_model.make_env()
+	else:
+		close_env(model.env)
+		model.make_env()
+	if dream is not None:
+		close_env(dream.env)
+		dream.make_env()
+
+
+def run_guarded(fn, *args):
+	# on an exception the env is rebuilt and fn run once more, returns None if that fails too
+	for attempt in range(2):
+		try:
+			return fn(*args)
+		except Exception:
+			sprint("rank", rank, "job failed", traceback.format_exc())
+			recreate_env()
+	return None
+
+
+def failed_result(worker_id, jobidx):
+	return [worker_id, jobidx, 0, 0, JOB_FAILED] + [0] * len(TIMING_FIELDS)
+
+
+def make_worker_envs(model_env=True):
+	global batch_model, dream
+	if dream_screen > 0:
+		dream = make_dream_model(numpy_rnn=numpy_rnn)
+		dream.make_env(proxy_reward=True)  # the dream env has no reward of its own
+	if batch_eval:
+		# one lane per episode of every job in a packet
+		batch_model = make_batch_model(num_episode * (SOLUTION_PACKET_SIZE // JOB_SIZE), numpy_rnn=numpy_rnn,
+									   numpy_vae=numpy_vae)
+		batch_model.make_env()
+	elif model_env:
+		model.make_env()
+
+
+def evaluate_packet(packet):
+	# runs the jobs of a packet addressed to this rank, returns the result packet
+	if noise_table_mode:
+		solutions = decode_noise_packet(packet)
+	else:
+		solutions = decode_solution_packet(packet)
+	results = []
+	pending = []  # solutions to evaluate w/ batch_eval
+	for solution in solutions:
+		worker_id, jobidx, seed, train_mode, max_len, reward_bound, weights = solution
+		assert train_mode in (1, 0, SKIP_JOB, DREAM_JOB), str(train_mode)
+		worker_id = int(worker_id)
+		possible_error = "work_id = " + str(worker_id) + " rank = " + str(rank)
+		assert worker_id == rank, possible_error
+		jobidx = int(jobidx)
+		seed = int(seed)
+		if train_mode == SKIP_JOB:
+			results.append([worker_id, jobidx] + [0] * (RESULT_SIZE - 2))  # the master has the result cached
+			continue
+		if train_mode == DREAM_JOB:
+			result = run_guarded(dream_worker, weights, seed, max_len)
+			if result is None:
+				results.append(failed_result(worker_id, jobidx))
+				continue
+			fitness, timesteps, timing = result
+			results.append([worker_id, jobidx, fitness, timesteps, 0] + timing)
+			continue
+		if batch_eval:
+			results.append(failed_result(worker_id, jobidx))  # filled in below, all jobs at once
+			pending.append((len(results) - 1, solution))
+			continue
+		result = run_guarded(worker, weights, seed, train_mode, max_len, reward_bound)
+		if result is None:
+			results.append(failed_result(worker_id, jobidx))
+			continue
+		fitness, timesteps, truncated, timing = result
+		results.append([worker_id, jobidx, fitness, timesteps, truncated] + timing)
+	if len(pending) > 0:
+		result = run_guarded(worker_batch, [solution for i, solution in pending])
+		if result is not None:
+			fitness, timesteps, truncated, timing = result
+			for j, (i, solution) in enumerate(pending):
+				results[i][2:] = [fitness[j], timesteps[j], truncated[j]] + timing[j]
+	result_packet = encode_result_packet(results)
+	assert len(result_packet) == RESULT_PACKET_SIZE
+	return result_packet
 
 
 def slave():
-	model.make_env()
+	send_host()
+	make_worker_envs()
 	packet = np.empty(SOLUTION_PACKET_SIZE, dtype=np.int32)
+	if transport == 'collective':
+		packet = packet_buffer
+	status = MPI.Status()
 	while 1:
-		comm.Recv(packet, source=0)
+		if noise_table_mode and dispatch_mode == 'queue':
+			comm.Probe(source=0, status=status)
+			if status.Get_tag() == THETA_TAG:
+				comm.Recv(noise_theta, source=0, tag=THETA_TAG)
+				continue
+		elif noise_table_mode:
+			broadcast_theta()
+		tag = 0
+		if transport == 'collective':
+			scatter_packets()
+		else:
+			comm.Recv(packet, source=0, status=status)
+			tag = status.Get_tag()  # the result goes back w/ the tag of the job
+			if tag == STOP_TAG:
+				return
 		assert (len(packet) == SOLUTION_PACKET_SIZE)
-		solutions = decode_solution_packet(packet)
-		results = []
-		for solution in solutions:
-			worker_id, jobidx, seed, train_mode, max_len, weights = solution
-			assert (train_mode == 1 or train_mode == 0), str(train_mode)
-			worker_id = int(worker_id)
-			possible_error = "work_id = " + str(worker_id) + " rank = " + str(rank)
-			assert worker_id == rank, possible_error
-			jobidx = int(jobidx)
-			seed = int(seed)
-			fitness, timesteps = worker(weights, seed, train_mode, max_len)
-			results.append([worker_id, jobidx, fitness, timesteps])
-		result_packet = encode_result_packet(results)
-		assert len(result_packet) == RESULT_PACKET_SIZE
-		comm.Send(result_packet, dest=0)
+		result_packet = evaluate_packet(packet)
+		if transport == 'collective':
+			result_packet_buffer[:] = result_packet
+			gather_packets()
+		else:
+			comm.Send(result_packet, dest=0, tag=tag)
 
 
 def send_packets_to_slaves(packet_list):
 	num_worker = comm.Get_size()
 	assert len(packet_list) == num_worker - 1
+	if transport == 'collective':
+		solution_buffer[1:] = packet_list
+		scatter_packets()
+		return
 	for i in range(1, num_worker):
 		packet = packet_list[i - 1]
 		assert (len(packet) == SOLUTION_PACKET_SIZE)
@@ -250,19 +887,27 @@ def send_packets_to_slaves(packet_list):
 def receive_packets_from_slaves():
 	result_packet = np.empty(RESULT_PACKET_SIZE, dtype=np.int32)
 
-	reward_list_total = np.zeros((population, 2))
+	reward_list_total = np.zeros((population, RESULT_SIZE - 2))
 
 	check_results = np.ones(population, dtype=np.int)
+	if transport == 'collective':
+		start_time = time.time()
+		gather_packets()
+		if telemetry is not None:
+			telemetry.wait += time.time() - start_time
 	for i in range(1, num_worker + 1):
-		comm.Recv(result_packet, source=i)
+		if transport == 'collective':
+			result_packet = result_buffer[i]
+		else:
+			receive_result(result_packet, source=i)
 		results = decode_result_packet(result_packet)
 		for result in results:
 			worker_id = int(result[0])
 			possible_error = "work_id = " + str(worker_id) + " source = " + str(i)
 			assert worker_id == i, possible_error
 			idx = int(result[1])
-			reward_list_total[idx, 0] = result[2]
-			reward_list_total[idx, 1] = result[3]
+			reward_list_total[idx] = result[2:]  # fitness, time steps, truncated episodes, timing
+			add_timing(i, result)
 			check_results[idx] = 0
 
 	check_sum = check_results.sum()
@@ -270,66 +915,445 @@ def receive_packets_from_slaves():
 	return reward_list_total
 
 
+class MasterWorker:
+	'''Runs jobs addressed to rank 0 in a background thread of the master.
+	All MPI calls stay on the main thread, it polls done() between probes for worker results.'''
+
+	def __init__(self):
+		make_worker_envs(model_env=False)  # master() made the env of model
+		self.jobs = queue.Queue()
+		self.results = queue.Queue()
+		self.thread = threading.Thread(target=self._run)
+		self.thread.daemon = True
+		self.thread.start()
+		# env steps hold the GIL, a shorter switch interval lets the main thread answer workers sooner
+		sys.setswitchinterval(0.001)
+
+	def submit(self, job):
+		self.jobs.put(np.copy(job))
+
+	def done(self):
+		return not self.results.empty()
+
+	def result(self):
+		return self.results.get()
+
+	def _run(self):
+		while True:
+			self.results.put(evaluate_packet(self.jobs.get()))
+
+
+def probe_result(status, in_flight, submitted=None):
+	'''Waits for the next result. Returns the rank that sent it, w/ status probed, 0 for a job the master ran itself,
+	or None once a job in flight on a worker has run past job_timeout or a batch was submitted by another thread.'''
+	start_time = time.time()
+	try:
+		if job_timeout <= 0 and 0 not in in_flight and submitted is None:
+			comm.Probe(source=MPI.ANY_SOURCE, tag=MPI.ANY_TAG, status=status)
+			return status.Get_source()
+		while not comm.Iprobe(source=MPI.ANY_SOURCE, tag=MPI.ANY_TAG, status=status):
+			if 0 in in_flight and master_worker.done():
+				return 0
+			if submitted is not None and not submitted.empty():
+				return None
+			now = time.time()
+			if job_timeout > 0 and any(now - sent > job_timeout for i, (batch, idx, sent) in in_flight.items() if i != 0):
+				return None
+			time.sleep(0.001)
+		return status.Get_source()
+	finally:
+		if telemetry is not None:
+			telemetry.wait += time.time() - start_time
+
+
+class JobBatch:
+	'''Jobs evaluated together, e.g. a generation. reward_list_total has a row per job once done is set.'''
+
+	def __init__(self, jobs):
+		self.jobs = jobs
+		n = len(jobs)
+		self.tag = None  # set by JobQueue.add
+		self.reward_list_total = np.zeros((n, RESULT_SIZE - 2))
+		self.check_results = np.ones(n, dtype=int)
+		self.attempts = np.zeros(n, dtype=int)
+		self.pending = list(range(n - 1, -1, -1))  # the next job is at the end
+		self.done = threading.Event()
+
+	def retry(self, idx):
+		# failed or timed out, handed out again unless it used up its attempts
+		self.attempts[idx] += 1
+		if self.attempts[idx] <= job_retries:
+			self.pending.append(idx)
+		else:
+			self.reward_list_total[idx, 2] = JOB_FAILED
+			self.check_results[idx] = 0
+
+
+class JobQueue:
+	'''Queue dispatch on the master: single jobs go to whichever worker is free, results come back from any source.
+	Several batches can be queued at once, e.g. by the runs of a sweep, they take turns handing out their jobs.
+	The jobs and results of a batch are tagged JOB_TAG + its number.'''
+
+	def __init__(self):
+		self.result_packet = np.empty(RESULT_PACKET_SIZE, dtype=np.int32)
+		self.status = MPI.Status()
+		self.free_workers = list(range(num_worker, 0, -1))
+		self.in_flight = {}  # worker -> batch, job, time sent
+		self.batches = OrderedDict()  # tag -> batch
+		self.number = 0
+		self.busy_time = np.zeros(num_worker + 1)
+		self.submitted = None  # w/ a sweep: batches of the run threads, handed to add() by the main thread
+
+	def add(self, batch):
+		self.number += 1
+		batch.tag = JOB_TAG + self.number % 16384
+		batch.start_time = time.time()
+		batch.busy_time = np.copy(self.busy_time)  # of the pool, subtracted when the batch is done
+		self.batches[batch.tag] = batch
+
+	def next_job(self):
+		for tag, batch in self.batches.items():
+			if len(batch.pending) > 0:
+				self.batches.move_to_end(tag)  # the batches take turns
+				return batch, batch.pending.pop()
+		return None, None
+
+	def dispatch(self):
+		while len(self.free_workers) > 0:
+			batch, idx = self.next_job()
+			if batch is None:
+				return
+			i = self.free_workers.pop()
+			batch.jobs[idx, 0] = i
+			comm.Send(batch.jobs[idx], dest=i, tag=batch.tag)
+			self.in_flight[i] = (batch, idx, time.time())
+		if master_worker is not None and 0 not in self.in_flight:
+			batch, idx = self.next_job()
+			if batch is not None:
+				batch.jobs[idx, 0] = 0
+				master_worker.submit(batch.jobs[idx])
+				self.in_flight[0] = (batch, idx, time.time())
+
+	def step(self):
+		# hands out jobs, then takes in one result or the batches submitted meanwhile
+		if self.submitted is not None:
+			while not self.submitted.empty():
+				self.add(self.submitted.get())
+		self.dispatch()
+		if len(self.in_flight) == 0 and len(lost_workers) == 0:
+			# nothing to wait for but the next batch
+			if self.submitted is not None:
+				try:
+					self.add(self.submitted.get(timeout=0.1))
+				except queue.Empty:
+					pass
+			return
+		i = probe_result(self.status, self.in_flight, self.submitted)
+		if i is None:
+			if job_timeout <= 0:
+				return  # a batch was submitted
+			now = time.time()
+			for i in [i for i, (batch, idx, sent) in self.in_flight.items() if i != 0 and now - sent > job_timeout]:
+				batch, idx, sent = self.in_flight.pop(i)
+				lost_workers.add(i)
+				sprint("worker", i, "timed out on job", idx, "after", int(now - sent), "s, taken out")
+				batch.retry(idx)
+				self.check_done(batch)
+			return
+		result_packet = self.result_packet
+		if i == 0:
+			result_packet[:] = master_worker.result()
+		else:
+			comm.Recv(result_packet, source=i, tag=self.status.Get_tag())
+			if i in lost_workers:
+				# the late result of a worker that was taken out, its job went to another, it is free again
+				lost_workers.discard(i)
+				if noise_table_mode:
+					comm.Send(noise_theta, dest=i, tag=THETA_TAG)  # it missed the theta of this generation
+				self.free_workers.append(i)
+				return
+		batch, idx, sent = self.in_flight.pop(i)
+		self.busy_time[i] += time.time() - sent
+		if i != 0:
+			self.free_workers.append(i)
+		results = decode_result_packet(result_packet)
+		for result in results:
+			worker_id = int(result[0])
+			possible_error = "work_id = " + str(worker_id) + " source = " + str(i)
+			assert worker_id == i, possible_error
+			idx = int(result[1])
+			if result[4] == JOB_FAILED:
+				batch.retry(idx)
+				continue
+			batch.reward_list_total[idx] = result[2:]  # fitness, time steps, truncated episodes, timing
+			add_timing(i, result)
+			batch.check_results[idx] = 0
+		self.check_done(batch)
+
+	def check_done(self, batch):
+		if batch.check_results.sum() > 0:
+			return
+		del self.batches[batch.tag]
+		elapsed_time = time.time() - batch.start_time
+		idle_time = elapsed_time - (self.busy_time - batch.busy_time)[1:]
+		sprint("worker idle time", int(np.mean(idle_time) * 100) / 100., "max", int(np.max(idle_time) * 100) / 100.,
+			   "fraction", int(np.sum(idle_time) / (elapsed_time * num_worker) * 10000) / 10000.)
+		batch.done.set()
+
+
+def run_queue(jobs):
+	# hand out single jobs to whichever worker is free, collect results from any source
+	global job_queue
+	batch = JobBatch(jobs)
+	if len(jobs) == 0:
+		return batch.reward_list_total
+	if job_queue is None:
+		job_queue = JobQueue()
+	if job_queue.submitted is not None and threading.current_thread() is not threading.main_thread():
+		# a run of a sweep, the main thread hands out the jobs
+		job_queue.submitted.put(batch)
+		batch.done.wait()
+		return batch.reward_list_total
+	job_queue.add(batch)
+	while not batch.done.is_set():
+		job_queue.step()
+	return batch.reward_list_total
+
+
+def fill_failed(reward_list_total):
+	# jobs that failed every attempt rank below all others
+	failed = reward_list_total[:, 2] == JOB_FAILED
+	if np.any(failed):
+		sprint("giving up on", int(np.sum(failed)), "failed jobs")
+		reward_list_total[failed] = 0
+		if not np.all(failed):
+			reward_list_total[failed, 0] = np.min(reward_list_total[~failed, 0])
+	return reward_list_total
+
+
+def dispatch_jobs(jobs):
+	if dispatch_mode == 'queue':
+		return run_queue(jobs)
+	send_packets_to_slaves(split_jobs(jobs))
+	reward_list_total = receive_packets_from_slaves()
+	for attempt in range(job_retries):
+		failed = reward_list_total[:, 2] == JOB_FAILED
+		if not np.any(failed):
+			break
+		sprint("running", int(np.sum(failed)), "failed jobs again")
+		# every worker gets its slice again, all but the failed jobs are skipped
+		retry_jobs = np.copy(jobs)
+		retry_jobs.view(np.int32)[~failed, 3] = SKIP_JOB
+		if noise_table_mode:
+			# the slaves take part in a broadcast of theta before every round of packets
+			broadcast_theta(noise_theta[:num_params], noise_theta[num_params:])
+		send_packets_to_slaves(split_jobs(retry_jobs))
+		reward_list_total[failed] = receive_packets_from_slaves()[failed]
+	return reward_list_total
+
+
+def job_key(job):
+	header = job.view(np.int32)
+	if noise_table_mode:
+		params_bytes = noise_theta.tobytes() + header[6:8].tobytes()  # the parameters follow from theta and the offset
+	else:
+		params_bytes = job[6:].tobytes()  # quantized (or float32) parameters as sent
+	return result_cache.key(params_bytes, header[2], header[4], header[3], header[5])
+
+
+def evaluate_jobs(jobs):
+	if result_cache is None:
+		return fill_failed(dispatch_jobs(jobs))
+
+	n = len(jobs)
+	# only evaluation jobs repeat, training jobs get fresh seeds and would evict them
+	keys = [job_key(jobs[i]) if jobs[i].view(np.int32)[3] == 0 else None for i in range(n)]
+	cached = [result_cache.get(key) if key is not None else None for key in keys]
+	miss = [i for i in range(n) if cached[i] is None]
+
+	reward_list_total = np.zeros((n, RESULT_SIZE - 2))
+	if dispatch_mode == 'queue':
+		if len(miss) > 0:
+			pending = jobs[miss]
+			pending.view(np.int32)[:, 1] = np.arange(len(miss))
+			reward_list_total[miss] = run_queue(pending)
+	else:
+		# every worker still gets its slice, jobs with a cached result are marked to be skipped
+		header = jobs.view(np.int32)
+		for i in range(n):
+			if cached[i] is not None:
+				header[i, 3] = SKIP_JOB
+		reward_list_total[miss] = dispatch_jobs(jobs)[miss]
+
+	for i in range(n):
+		if cached[i] is not None:
+			reward_list_total[i] = cached[i]
+			reward_list_total[i, 3:] = 0  # no time was spent on it
+		elif keys[i] is not None and reward_list_total[i, 2] != JOB_FAILED:
+			result_cache.put(keys[i], np.copy(reward_list_total[i]))
+	return fill_failed(reward_list_total)
+
+
+def init_result_cache():
+	global result_cache
+	if cache_size <= 0:
+		return
+	context = json.dumps([gamename, num_episode, batch_mode, batch_eval, stop_window, stop_grace, dream_episode])
+	result_cache = ResultCache(filebase + '.cache.npz', cache_size, context)
+	result_cache.load()
+	sprint("result cache", result_cache.filename, "entries", len(result_cache.entries))
+
+
 def evaluate_batch(model_params, max_len=-1):
 	# duplicate model_params
 	solutions = []
-	for i in range(es.popsize):
+	for i in range(population):
 		solutions.append(np.copy(model_params))
 
-	seeds = np.arange(es.popsize)
+	seeds = np.arange(population)
 
-	packet_list = encode_solution_packets(seeds, solutions, train_mode=0, max_len=max_len)
+	if noise_table_mode:
+		broadcast_theta(model_params, 0)
+		noise_index = -np.ones(es.popsize)
+		jobs = encode_noise_jobs(seeds, noise_index, noise_index, train_mode=0, max_len=max_len)
+	else:
+		jobs = encode_solution_jobs(seeds, solutions, train_mode=0, max_len=max_len)
 
-	send_packets_to_slaves(packet_list)
-	reward_list_total = receive_packets_from_slaves()
+	reward_list_total = evaluate_jobs(jobs)
 
 	reward_list = reward_list_total[:, 0]  # get rewards
 	return np.mean(reward_list)
 
 
-def master():
-	start_time = int(time.time())
-	sprint("training", gamename)
-	sprint("population", es.popsize)
-	sprint("num_worker", num_worker)
-	sprint("num_worker_trial", num_worker_trial)
-	sys.stdout.flush()
+def next_seeds(seeder, n):
+	if antithetic:
+		seeds = seeder.next_batch(int(n / 2))
+		return seeds + seeds
+	return seeder.next_batch(n)
+
+
+def race(encode, seeder, n):
+	'''Racing / successive halving over the n candidates of a generation, with queue dispatch.
+	encode(seeds, idx) returns the jobs of candidates idx. Every candidate starts w/ one job, the cost of a
+	generation w/o racing. The half closest to the elite cut gets a second one, after that each round doubles
+	the jobs of the candidates whose rank against the cut is still uncertain, at most half of the racing
+	candidates go on. Returns fitness, time steps and truncated episodes per candidate.'''
+	fitness = [[] for i in range(n)]
+	timesteps = [[] for i in range(n)]
+	truncated = np.zeros(n)
+	num_elite = min(max(1, int(np.ceil(race_elite * n))), n - 1)
+	racing = np.arange(n)
+	num_rounds = 0
+	num_jobs = 0
+	while len(racing) > 0:
+		# the racing candidates all have the same number of jobs, this round doubles it
+		num_new = min(max(1, len(fitness[racing[0]])), race_jobs - len(fitness[racing[0]]))
+		jobs = np.concatenate([encode(np.array(next_seeds(seeder, n))[racing], racing) for j in range(num_new)])
+		jobs.view(np.int32)[:, 1] = np.arange(len(jobs))
+		reward_list_total = evaluate_jobs(jobs)
+		for k, i in enumerate(np.tile(racing, num_new)):
+			fitness[i].append(reward_list_total[k, 0])
+			timesteps[i].append(reward_list_total[k, 1])
+			truncated[i] += reward_list_total[k, 2]
+		num_rounds += 1
+		num_jobs += len(jobs)
+
+		mean = np.array([np.mean(f) for f in fitness])
+		order = np.sort(mean)[::-1]
+		cut = (order[num_elite - 1] + order[num_elite]) / 2.
+		if len(fitness[racing[0]]) >= race_jobs:
+			break
+		if len(fitness[racing[0]]) < 2:
+			# no standard error from one job yet, the half closest to the cut goes on
+			distance = np.abs(mean[racing] - cut)
+			uncertain = np.ones(len(racing), dtype=bool)
+		else:
+			stderr = np.array([np.std(fitness[i], ddof=1) / np.sqrt(len(fitness[i])) for i in racing])
+			distance = np.abs(mean[racing] - cut) / np.maximum(stderr, 1e-8)  # standard errors to the cut
+			uncertain = distance < race_z  # nothing left uncertain ends the race
+		closest = np.argsort(distance[uncertain])[:(len(racing) + 1) // 2]
+		racing = np.sort(racing[uncertain][closest])
+
+	sprint("race", "rounds", num_rounds, "episodes", num_jobs * num_episode, "of", n * race_jobs * num_episode)
+	result = np.zeros((n, RESULT_SIZE - 2))
+	for i in range(n):
+		result[i, 0] = np.min(fitness[i]) if batch_mode == 'min' else np.mean(fitness[i])
+		result[i, 1] = np.mean(timesteps[i])
+		result[i, 2] = truncated[i]
+	return result
 
-	seeder = Seeder(seed_start)
 
-	filename = filebase + '.json'
-	filename_log = filebase + '.log.json'
-	filename_hist = filebase + '.hist.json'
-	filename_hist_best = filebase + '.hist_best.json'
-	filename_best = filebase + '.best.json'
+def correlation(x, y):
+	if len(x) < 2 or np.std(x) == 0 or np.std(y) == 0:
+		return float('nan')
+	return float(np.corrcoef(x, y)[0, 1])
 
-	model.make_env()
 
-	t = 0
+def screen(encode, seeder, n):
+	'''Multi-fidelity evaluation of the n candidates of a generation, with queue dispatch.
+	encode(seeds, idx, train_mode) returns the jobs of candidates idx. All candidates are run in the dream env,
+	the best dream_screen fraction in the real env (racing if enabled). The others are ranked below every real
+	fitness, in the order of their dream fitness. Returns fitness, time steps and truncated episodes.'''
+	seeds = np.array(next_seeds(seeder, n))
+	dream_fitness = evaluate_jobs(encode(seeds, np.arange(n), DREAM_JOB))[:, 0]
 
-	history = []
-	history_best = []  # stores evaluation averages every 25 steps or so
-	eval_log = []
-	best_reward_eval = 0
-	best_model_params_eval = None
+	num_kept = min(max(2, int(np.ceil(dream_screen * n))), n)
+	kept = np.sort(np.argsort(-dream_fitness)[:num_kept])
+	if race_jobs > 1:
+		real = race(lambda race_seeds, idx: encode(race_seeds, kept[idx]), seeder, num_kept)
+	else:
+		real = evaluate_jobs(encode(seeds[kept], kept))
+
+	result = np.zeros((n, RESULT_SIZE - 2))
+	result[kept] = real
+	dropped = np.setdiff1d(np.arange(n), kept)
+	if len(dropped) > 0:
+		result[dropped, 0] = np.min(real[:, 0]) - (np.min(dream_fitness[kept]) - dream_fitness[dropped])
+		result[dropped, 1] = np.mean(real[:, 1])
+
+	# over the kept candidates only, the others have no real fitness
+	dream_rank = np.argsort(np.argsort(dream_fitness[kept]))
+	real_rank = np.argsort(np.argsort(real[:, 0]))
+	sprint("dream screen", "kept", num_kept, "of", n,
+		   "pearson", round(correlation(dream_fitness[kept], real[:, 0]), 4),
+		   "spearman", round(correlation(dream_rank, real_rank), 4))
+	return result
 
-	max_len = -1  # max time steps (-1 means ignore)
 
-	while True:
-		t += 1
+class Experiment:
+	'''Bookkeeping of an ES run on the master: generation history, evaluations, log files and checkpoints.'''
 
-		solutions = es.ask()
+	def __init__(self, es, seeder, filebase, name=None):
+		self.es = es
+		self.seeder = seeder
+		self.name = gamename if name is None else name  # printed w/ the history of every generation
+		self.start_time = int(time.time())
 
-		if antithetic:
-			seeds = seeder.next_batch(int(es.popsize / 2))
-			seeds = seeds + seeds
-		else:
-			seeds = seeder.next_batch(es.popsize)
+		# .json and .best.json are snapshots, the others are append-only JSONL (see train_log.py)
+		self.filename = filebase + '.json'
+		self.filename_log = filebase + '.log.jsonl'
+		self.filename_hist = filebase + '.hist.jsonl'
+		self.filename_hist_best = filebase + '.hist_best.jsonl'
+		self.filename_best = filebase + '.best.json'
+		self.filename_checkpoint = filebase + '.checkpoint.npz'
+		self.log = LogWriter()
+
+		self.t = 0
 
-		packet_list = encode_solution_packets(seeds, solutions, max_len=max_len)
+		self.history = []
+		self.history_best = []  # stores evaluation averages every 25 steps or so
+		self.eval_log = []
+		self.best_reward_eval = 0
+		self.best_model_params_eval = None
 
-		send_packets_to_slaves(packet_list)
-		reward_list_total = receive_packets_from_slaves()
+		self.max_len = -1  # max time steps (-1 means ignore)
+		self.min_reward_rate = None  # reward per step below which training episodes are stopped (None means ignore)
+
+	def record(self, reward_list_total):
+		# called once the rewards of a generation have been told to the optimizer
+		es = self.es
+		self.t += 1
+		t = self.t
 
 		reward_list = reward_list_total[:, 0]  # get rewards
 
@@ -338,8 +1362,6 @@ def master():
 		avg_reward = int(np.mean(reward_list) * 100) / 100.  # get average time step
 		std_reward = int(np.std(reward_list) * 100) / 100.  # get average time step
 
-		es.tell(reward_list)
-
 		es_solution = es.result()
 		model_params = es_solution[0]  # best historical solution
 		reward = es_solution[1]  # best reward
@@ -349,65 +1371,353 @@ def master():
 		r_max = int(np.max(reward_list) * 100) / 100.
 		r_min = int(np.min(reward_list) * 100) / 100.
 
-		curr_time = int(time.time()) - start_time
+		curr_time = int(time.time()) - self.start_time
 
 		h = (
 			t, curr_time, avg_reward, r_min, r_max, std_reward, int(es.rms_stdev() * 100000) / 100000.,
 			mean_time_step + 1.,
 			int(max_time_step) + 1)
 
+		truncated = reward_list_total[:, 2]
 		if cap_time_mode:
-			max_len = 2 * int(mean_time_step + 1.0)
+			# stopped episodes say little about how long a full one takes
+			time_steps = reward_list_total[truncated == 0, 1]
+			if len(time_steps) > 0:
+				self.max_len = 2 * int(np.mean(time_steps) + 1.0)
+			else:
+				self.max_len = 2 * int(mean_time_step + 1.0)
 		else:
-			max_len = -1
+			self.max_len = -1
+		if stop_quantile > 0:
+			# pace of the stop_quantile of this generation, training episodes of the next one falling behind it stop
+			reward_rate = reward_list / (reward_list_total[:, 1] + 1.0)
+			self.min_reward_rate = float(np.quantile(reward_rate, stop_quantile))
 
-		history.append(h)
+		self.history.append(h)
 
-		with open(filename, 'wt') as out:
-			res = json.dump([np.array(es.current_param()).round(4).tolist()], out, sort_keys=True, indent=2,
-							separators=(',', ': '))
+		self.log.snapshot(self.filename, [np.array(es.current_param()).round(4)], sort_keys=True, indent=2,
+						  separators=(',', ': '))
+		self.log.append(self.filename_hist, h)
 
-		with open(filename_hist, 'wt') as out:
-			res = json.dump(history, out, sort_keys=False, indent=0, separators=(',', ':'))
-
-		sprint(gamename, h)
+		sprint(self.name, h)
+		if stop_window > 0 or stop_quantile > 0:
+			sprint("early stop", "truncated episodes", int(np.sum(truncated)), "of", len(truncated) * num_episode,
+				   "jobs", int(np.sum(truncated > 0)), "min reward rate", self.min_reward_rate)
 
 		if (t == 1):
-			best_reward_eval = avg_reward
+			self.best_reward_eval = avg_reward
 		if (t % eval_steps == 0):  # evaluate on actual task at hand
 
-			prev_best_reward_eval = best_reward_eval
+			prev_best_reward_eval = self.best_reward_eval
 			model_params_quantized = np.array(es.current_param()).round(4)
 			reward_eval = evaluate_batch(model_params_quantized, max_len=-1)
 			model_params_quantized = model_params_quantized.tolist()
-			improvement = reward_eval - best_reward_eval
-			eval_log.append([t, reward_eval, model_params_quantized])
-			with open(filename_log, 'wt') as out:
-				res = json.dump(eval_log, out)
-			if (len(eval_log) == 1 or reward_eval > best_reward_eval):
-				best_reward_eval = reward_eval
-				best_model_params_eval = model_params_quantized
+			improvement = reward_eval - self.best_reward_eval
+			self.eval_log.append([t, reward_eval, model_params_quantized])
+			self.log.append(self.filename_log, self.eval_log[-1])
+			if (len(self.eval_log) == 1 or reward_eval > self.best_reward_eval):
+				self.best_reward_eval = reward_eval
+				self.best_model_params_eval = model_params_quantized
 			else:
 				if retrain_mode:
-					sprint("reset to previous best params, where best_reward_eval =", best_reward_eval)
-					es.set_mu(best_model_params_eval)
-			with open(filename_best, 'wt') as out:
-				res = json.dump([best_model_params_eval, best_reward_eval], out, sort_keys=True, indent=0,
-								separators=(',', ': '))
+					sprint("reset to previous best params, where best_reward_eval =", self.best_reward_eval)
+					es.set_mu(self.best_model_params_eval)
+			self.log.snapshot(self.filename_best, [self.best_model_params_eval, self.best_reward_eval], sort_keys=True,
+							  indent=0, separators=(',', ': '))
 			# dump history of best
-			curr_time = int(time.time()) - start_time
+			curr_time = int(time.time()) - self.start_time
 			best_record = [t, curr_time, "improvement", improvement, "curr", reward_eval, "prev", prev_best_reward_eval,
-						   "best", best_reward_eval]
-			history_best.append(best_record)
-			with open(filename_hist_best, 'wt') as out:
-				res = json.dump(history_best, out, sort_keys=False, indent=0, separators=(',', ':'))
+						   "best", self.best_reward_eval]
+			self.history_best.append(best_record)
+			self.log.append(self.filename_hist_best, best_record)
 
 			sprint("Eval", t, curr_time, "improvement", improvement, "curr", reward_eval, "prev", prev_best_reward_eval,
-				   "best", best_reward_eval)
+				   "best", self.best_reward_eval)
+			if result_cache is not None:
+				sprint("result cache", "hits", result_cache.hits, "misses", result_cache.misses, "entries",
+					   len(result_cache.entries))
+
+		if checkpoint_steps > 0 and t % checkpoint_steps == 0:
+			self.checkpoint()
+
+	def get_state(self):
+		state = {'t': np.asarray(self.t), 'time': np.asarray(int(time.time()) - self.start_time),
+				 'history': np.array(self.history).reshape(-1, 9),
+				 # generation, time, improvement, curr, prev, best
+				 'history_best': np.array([r[0:2] + r[3::2] for r in self.history_best]).reshape(-1, 6),
+				 'eval_t': np.array([r[0] for r in self.eval_log]),
+				 'eval_reward': np.array([r[1] for r in self.eval_log]),
+				 'eval_params': np.array([r[2] for r in self.eval_log]).reshape(len(self.eval_log), num_params),
+				 'best_reward_eval': np.asarray(self.best_reward_eval),
+				 'max_len': np.asarray(self.max_len)}
+		if self.min_reward_rate is not None:
+			state['min_reward_rate'] = np.asarray(self.min_reward_rate)
+		if self.best_model_params_eval is not None:
+			state['best_model_params_eval'] = np.array(self.best_model_params_eval)
+		return state
+
+	def set_state(self, state):
+		self.t = int(state['t'])
+		self.start_time = int(time.time()) - int(state['time'])
+		self.history = [(int(h[0]), int(h[1])) + tuple(h[2:8].tolist()) + (int(h[8]),) for h in state['history']]
+		self.history_best = [[int(r[0]), int(r[1]), "improvement", r[2], "curr", r[3], "prev", r[4], "best", r[5]]
+							 for r in state['history_best'].tolist()]
+		self.eval_log = [[int(t), reward, params] for t, reward, params in
+						 zip(state['eval_t'], state['eval_reward'].tolist(), state['eval_params'].tolist())]
+		self.best_reward_eval = float(state['best_reward_eval'])
+		self.best_model_params_eval = None
+		if 'best_model_params_eval' in state:
+			self.best_model_params_eval = state['best_model_params_eval'].tolist()
+		self.max_len = int(state['max_len'])
+		self.min_reward_rate = None
+		if 'min_reward_rate' in state:
+			self.min_reward_rate = float(state['min_reward_rate'])
+		# the history files start over from the checkpoint, generations logged after it are run again
+		for h in self.history:
+			self.log.append(self.filename_hist, h)
+		for r in self.eval_log:
+			self.log.append(self.filename_log, r)
+		for r in self.history_best:
+			self.log.append(self.filename_hist_best, r)
+
+	def checkpoint(self):
+		state = {}
+		for prefix, obj in (('es.', self.es), ('seeder.', self.seeder), ('run.', self)):
+			for key, value in obj.get_state().items():
+				state[prefix + key] = value
+		tmp = self.filename_checkpoint + '.tmp'
+		with open(tmp, 'wb') as f:
+			np.savez(f, **state)
+		os.replace(tmp, self.filename_checkpoint)  # a crash while saving leaves the previous checkpoint intact
+		if result_cache is not None:
+			result_cache.save()
+
+	def resume(self):
+		# returns False if there is no checkpoint to resume from
+		if not os.path.exists(self.filename_checkpoint):
+			return False
+		with np.load(self.filename_checkpoint) as data:
+			for prefix, obj in (('es.', self.es), ('seeder.', self.seeder), ('run.', self)):
+				obj.set_state({key[len(prefix):]: data[key] for key in data.files if key.startswith(prefix)})
+		return True
+
+
+def master():
+	global telemetry, master_worker
+	sprint("training", gamename)
+	sprint("population", es.popsize)
+	sprint("num_worker", num_worker)
+	sprint("num_worker_trial", num_worker_trial)
+	sys.stdout.flush()
+
+	seeder = Seeder(es.rng)
+
+	model.make_env()
+	if master_eval:
+		master_worker = MasterWorker()
+	init_result_cache()
+
+	run = Experiment(es, seeder, filebase)
+	telemetry = Telemetry(filebase + '.telemetry.jsonl', run.log, receive_hosts())
+	if resume_mode:
+		if run.resume():
+			sprint("resumed from", run.filename_checkpoint, "at generation", run.t)
+		else:
+			sprint("no checkpoint at", run.filename_checkpoint, "starting from scratch")
+	train(es, run)
+
+
+def train(es, run, generations=0):
+	# the generations of a run, without end for generations = 0
+	seeder = run.seeder
+	surrogate_es = None
+	if surrogate:
+		surrogate_es = SurrogateES(es, kernel=surrogate, keep=surrogate_keep)
+	reuse_es = None
+	if reuse_generations > 0:
+		reuse_es = ReuseES(es, generations=reuse_generations)
+
+	while generations <= 0 or run.t < generations:
+		if surrogate_es is not None:
+			solutions = np.asarray(surrogate_es.ask())
+		elif reuse_es is not None:
+			solutions = np.asarray(reuse_es.ask())
+		else:
+			solutions = np.asarray(es.ask())
+		noise_es = es if surrogate_es is None else surrogate_es  # noise_index and noise_sign of the solutions
+
+		if noise_table_mode:
+			broadcast_theta(es.mu, es.sigma)
+
+		def encode(seeds, idx, train_mode=1):
+			# jobs of the candidates idx
+			if noise_table_mode:
+				return encode_noise_jobs(seeds, noise_es.noise_index[idx], noise_es.noise_sign[idx],
+										 train_mode=train_mode, max_len=run.max_len, min_reward_rate=run.min_reward_rate)
+			return encode_solution_jobs(seeds, solutions[idx], train_mode=train_mode, max_len=run.max_len,
+										min_reward_rate=run.min_reward_rate)
+
+		n = len(solutions)
+		if dream_screen > 0:
+			reward_list_total = screen(encode, seeder, n)
+		elif race_jobs > 1:
+			reward_list_total = race(encode, seeder, n)
+		else:
+			reward_list_total = evaluate_jobs(encode(next_seeds(seeder, n), np.arange(n)))
+
+		if surrogate_es is not None:
+			surrogate_es.tell(reward_list_total[:, 0])
+			sprint("surrogate", "screened", surrogate_es.num_candidates, "evaluated", surrogate_es.num_evaluated,
+				   "rank correlation", round(surrogate_es.rank_correlation, 4), "savings", round(surrogate_es.savings(), 4))
+		elif reuse_es is not None:
+			reuse_es.tell(reward_list_total[:, 0])
+			sprint("reuse", "generations", len(reuse_es.history), "effective samples", round(reuse_es.effective_size, 1))
+		else:
+			es.tell(reward_list_total[:, 0])
+
+		run.record(reward_list_total)
+		if telemetry is not None:
+			telemetry.end_generation(run.t)
+
+
+def master_sweep():
+	'''Several ES runs sharing the workers. Each run trains in a thread of the master, the main thread hands out
+	the jobs of all of them through one JobQueue, so the workers stay busy while a run waits on the last jobs of
+	a generation, evaluates or has finished. The runs log to their own files, there is no telemetry.'''
+	global job_queue
+	sprint("sweep", sweep_runs, "generations", sweep_generations)
+	sprint("population", population)
+	sprint("num_worker", num_worker)
+	sys.stdout.flush()
+
+	model.make_env()
+	receive_hosts()
+	job_queue = JobQueue()
+	job_queue.submitted = queue.Queue()
+
+	threads = []
+	for (name, seed), run_es in zip(sweep_runs, sweep_es):
+		run_filebase = 'log/' + gamename + '.' + name + '.' + str(num_episode) + '.' + str(population) + '.s' + str(seed)
+		run = Experiment(run_es, Seeder(run_es.rng), run_filebase, name=gamename + '.' + name + '.s' + str(seed))
+		if resume_mode and run.resume():
+			sprint("resumed from", run.filename_checkpoint, "at generation", run.t)
+		thread = threading.Thread(target=train, args=(run_es, run, sweep_generations))
+		thread.daemon = True
+		thread.start()
+		threads.append(thread)
+
+	while any(thread.is_alive() for thread in threads):
+		job_queue.step()
+	sprint("sweep done")
+	stop = np.zeros(SOLUTION_PACKET_SIZE, dtype=np.int32)
+	for i in range(1, num_worker + 1):
+		comm.Send(stop, dest=i, tag=STOP_TAG)
+
+
+def master_async():
+	# steady state: every worker always has a job, the optimizer is updated once a quorum of results is in
+	global telemetry
+	sprint("training", gamename)
+	sprint("population", es.popsize)
+	sprint("num_worker", num_worker)
+	sprint("async_quorum", async_quorum)
+	sys.stdout.flush()
+
+	seeder = Seeder(es.rng)
+
+	model.make_env()
+	init_result_cache()
+
+	run = Experiment(es, seeder, filebase)
+	telemetry = Telemetry(filebase + '.telemetry.jsonl', run.log, receive_hosts())
+	if resume_mode:
+		# jobs that were in flight at the checkpoint are not restored, the first batch is asked for again
+		if run.resume():
+			sprint("resumed from", run.filename_checkpoint, "at generation", run.t)
+		else:
+			sprint("no checkpoint at", run.filename_checkpoint, "starting from scratch")
+	async_es = AsyncES(es, quorum=async_quorum, max_staleness=max_staleness, staleness_decay=staleness_decay)
+
+	result_packet = np.empty(RESULT_PACKET_SIZE, dtype=np.int32)
+	status = MPI.Status()
+	free_workers = list(range(num_worker, 0, -1))
+	in_flight = {}  # worker -> job id, job
+	reward_table = {}  # job id -> fitness, timesteps, truncated episodes and timing
+	failed_jobs = []  # jobs to hand out again
+	attempts = {}  # job id -> failed attempts
+	seeds = []
+
+	def receive():
+		receive_result(result_packet, source=MPI.ANY_SOURCE, status=status)
+		i = status.Get_source()
+		result = decode_result_packet(result_packet)[0]
+		worker_id, job_id, fitness = result[0:3]
+		possible_error = "work_id = " + str(worker_id) + " source = " + str(i)
+		assert int(worker_id) == i, possible_error
+		in_flight_id, job = in_flight.pop(i)
+		assert in_flight_id == job_id
+		free_workers.append(i)
+		if result[4] == JOB_FAILED:
+			attempts[job_id] = attempts.get(job_id, 0) + 1
+			if attempts[job_id] <= job_retries:
+				failed_jobs.append(job)
+				return
+			# given up on, ranks below the results so far
+			del attempts[job_id]
+			sprint("giving up on failed job", int(job_id))
+			fitness = min([r[0] for r in reward_table.values()], default=0)
+			result = result[:2] + [fitness] + [0] * (RESULT_SIZE - 3)
+		add_timing(i, result)
+		if async_es.tell(job_id, fitness):
+			reward_table[job_id] = result[2:]
+
+	while True:
+		while len(free_workers) > 0:
+			i = free_workers.pop()
+			if len(failed_jobs) > 0:
+				job = failed_jobs.pop()
+				job_id = job[1]
+			else:
+				job_id, idx, solution = async_es.ask()
+				if idx == 0:
+					seeds = next_seeds(seeder, len(async_es.batch))
+				job = encode_solution_jobs([seeds[idx]], [solution], max_len=run.max_len,
+										   min_reward_rate=run.min_reward_rate)[0]
+				job[1] = job_id
+			job[0] = i
+			comm.Send(job, dest=i)
+			in_flight[i] = (job_id, job)
+
+		receive()
+
+		if async_es.ready():
+			job_ids = async_es.update()
+			if (run.t + 1) % eval_steps == 0:
+				# the evaluation batch needs every worker
+				while len(in_flight) > 0:
+					receive()
+			run.record(np.array([reward_table.pop(job_id) for job_id in job_ids]))
+			telemetry.end_generation(run.t)
+			sprint("async", "results", len(job_ids), "stale", async_es.num_stale, "discarded",
+				   async_es.num_discarded, "in flight", len(in_flight))
+
+
+def local_slave(local_comm, args):
+	# entry point of the worker processes of the local backend
+	global comm, rank
+	comm = local_comm
+	rank = comm.Get_rank()
+	main(args)
 
 
 def main(args):
+	global MPI, comm, backend
 	global optimizer, num_episode, eval_steps, num_worker, num_worker_trial, antithetic, seed_start, retrain_mode, cap_time_mode
+	global noise_table_mode, noise_table_size, noise_seed, dispatch_mode, population_size
+	global async_quorum, max_staleness, staleness_decay, transport
+	global checkpoint_steps, resume_mode, low_memory, batch_eval, numpy_rnn, numpy_vae, cache_size, stop_window, stop_quantile, stop_grace
+	global race_jobs, race_elite, race_z, dream_screen, dream_episode, surrogate, surrogate_keep, reuse_generations
+	global straggler_ratio, job_retries, job_timeout, hierarchy, master_eval, sweep_runs, sweep_generations
 
 	optimizer = args.optimizer
 	num_episode = args.num_episode
@@ -418,12 +1728,108 @@ def main(args):
 	retrain_mode = (args.retrain == 1)
 	cap_time_mode = (args.cap_time == 1)
 	seed_start = args.seed_start
+	noise_table_mode = (args.noise_table == 1)
+	noise_table_size = args.noise_table_size
+	noise_seed = args.noise_seed
+	dispatch_mode = args.dispatch
+	population_size = args.population
+	async_quorum = args.async_quorum
+	max_staleness = args.max_staleness
+	staleness_decay = args.staleness_decay
+	transport = args.transport
+	checkpoint_steps = args.checkpoint_steps
+	resume_mode = (args.resume == 1)
+	low_memory = (args.low_memory == 1)
+	batch_eval = (args.batch_eval == 1)
+	numpy_rnn = (args.numpy_rnn == 1)
+	numpy_vae = (args.numpy_vae == 1)
+	cache_size = args.cache_size
+	stop_window = args.stop_window
+	stop_quantile = args.stop_quantile
+	stop_grace = args.stop_grace
+	race_jobs = args.race_jobs
+	race_elite = args.race_elite
+	race_z = args.race_z
+	dream_screen = args.dream_screen
+	dream_episode = args.dream_episode
+	surrogate = args.surrogate
+	surrogate_keep = args.surrogate_keep
+	reuse_generations = args.reuse
+	straggler_ratio = args.straggler_ratio
+	job_retries = args.job_retries
+	job_timeout = args.job_timeout
+	hierarchy = (args.hierarchy == 1)
+	master_eval = (args.master_eval == 1)
+	sweep_runs = []
+	for entry in args.sweep.split(','):
+		if entry:
+			name, seed = (entry.split(':') + [str(seed_start)])[:2]
+			sweep_runs.append((name, int(seed)))
+	sweep_generations = args.sweep_generations
+	if transport == 'collective':
+		assert dispatch_mode == 'static', "collective transport needs --dispatch static."
+	if len(sweep_runs) > 0:
+		assert dispatch_mode == 'queue' and async_quorum == 0, "a sweep needs --dispatch queue w/o async mode."
+		assert not noise_table_mode, "a sweep does not work w/ the noise table."
+		assert cache_size == 0, "a sweep does not work w/ the result cache."
+		assert not master_eval, "a sweep does not work w/ master evaluation."
+		for name, seed in sweep_runs:
+			assert name in ('ses', 'pepg', 'openes', 'ga', 'cma', 'sepcma'), "unknown optimizer " + name
+			if low_memory or reuse_generations > 0:
+				assert name in ('ses', 'pepg', 'openes'), "low memory mode and reuse only work w/ ses, pepg, openes."
+	if master_eval:
+		assert dispatch_mode == 'queue' and async_quorum == 0, "master evaluation needs --dispatch queue w/o async mode."
+	if hierarchy:
+		assert transport == 'collective', "the hierarchy needs --transport collective."
+		assert args.backend == 'mpi', "the hierarchy needs --backend mpi."
+	if race_jobs > 1:
+		assert dispatch_mode == 'queue', "racing needs --dispatch queue."
+		assert async_quorum == 0, "racing does not work in async mode."
+	if dream_screen > 0:
+		assert dispatch_mode == 'queue', "the dream screen needs --dispatch queue."
+		assert async_quorum == 0, "the dream screen does not work in async mode."
+	if surrogate:
+		assert surrogate in ('ridge', 'rbf'), "--surrogate is ridge or rbf."
+		assert dispatch_mode == 'queue', "the surrogate needs --dispatch queue."
+		assert async_quorum == 0, "the surrogate does not work in async mode."
+		assert reuse_generations == 0, "the surrogate does not work w/ reuse."
+	if reuse_generations > 0:
+		assert optimizer in ('ses', 'pepg', 'openes'), "reuse only works w/ ses, pepg, openes."
+		assert async_quorum == 0, "reuse does not work in async mode."
+	if job_timeout > 0:
+		assert dispatch_mode == 'queue' and async_quorum == 0, "job timeouts need --dispatch queue w/o async mode."
+	if low_memory:
+		assert optimizer in ('ses', 'pepg', 'openes'), "low memory mode only works w/ ses, pepg, openes."
+	if async_quorum > 0:
+		assert dispatch_mode == 'queue', "async mode needs --dispatch queue."
+		assert optimizer in ('ses', 'pepg', 'openes', 'ga'), "async mode only works w/ ses, pepg, openes, ga."
+		assert not noise_table_mode, "async mode does not work w/ the noise table."
+
+	backend = args.backend
+	if backend == 'local':
+		MPI = local_backend  # provides Status and ANY_SOURCE in place of mpi4py
+
+	if hierarchy:
+		split_nodes()
 
 	initialize_settings(args.sigma_init, args.sigma_decay)
 
+	if backend == 'local' and rank == 0:
+		os.environ.update(
+			MKL_NUM_THREADS="1",
+			OMP_NUM_THREADS="1"
+		)
+		slot_size = 8 * (SOLUTION_PACKET_SIZE + RESULT_PACKET_SIZE + 2 * num_params) + 1024
+		comm = local_backend.start(num_worker + 1, local_slave, (args,), slot_size=slot_size)
+
 	sprint("process", rank, "out of total ", comm.Get_size(), "started")
 	if (rank == 0):
-		master()
+		if len(sweep_runs) > 0:
+			master_sweep()
+		elif async_quorum > 0:
+			master_async()
+		else:
+			master()
 	else:
 		slave()
 
@@ -455,22 +1861,85 @@ def mpi_fork(n):
 
 if __name__ == "__main__":
 	parser = argparse.ArgumentParser(description=('Train policy on OpenAI Gym environment '
-												  'using pepg, ses, openes, ga, cma'))
+												  'using pepg, ses, openes, ga, cma, sepcma'))
 
-	parser.add_argument('-o', '--optimizer', type=str, help='ses, pepg, openes, ga, cma.', default='cma')
+	parser.add_argument('--backend', type=str, default='mpi',
+						help='mpi: relaunch w/ mpirun, local: worker processes on this machine w/o MPI.')
+	parser.add_argument('-o', '--optimizer', type=str, help='ses, pepg, openes, ga, cma, sepcma.', default='cma')
 	parser.add_argument('--num_episode', type=int, default=16, help='num episodes per trial')
 	parser.add_argument('--eval_steps', type=int, default=25, help='evaluate every eval_steps step')
 	parser.add_argument('-n', '--num_worker', type=int, default=64)
+	parser.add_argument('--numpy_rnn', type=int, default=0,
+						help='set to 1 to step the MDN-RNN in NumPy instead of TensorFlow.')
+	parser.add_argument('--numpy_vae', type=int, default=0,
+						help='set to 1 to encode frames w/ a NumPy VAE encoder instead of TensorFlow.')
+	parser.add_argument('--batch_eval', type=int, default=0,
+						help='set to 1 to run the episodes of all trials of a worker in lockstep, batched.')
 	parser.add_argument('-t', '--num_worker_trial', type=int, help='trials per worker', default=1)
+	parser.add_argument('--hierarchy', type=int, default=0,
+						help='set to 1 for a sub-master per node that relays the jobs and results of its ranks.\n needs --transport collective.')
+	parser.add_argument('--dispatch', type=str, default='static',
+						help='static: fixed slice of the population per worker, queue: jobs on demand.')
+	parser.add_argument('-p', '--population', type=int, default=-1,
+						help='population size w/ queue dispatch, -1 means num_worker * num_worker_trial.')
+	parser.add_argument('--transport', type=str, default='p2p',
+						help='p2p: int32 packets per rank, collective: float Scatter/Gather, needs --dispatch static.')
 	parser.add_argument('--antithetic', type=int, default=1, help='set to 0 to disable antithetic sampling')
 	parser.add_argument('--cap_time', type=int, default=0,
 						help='set to 0 to disable capping timesteps to 2x of average.')
+	parser.add_argument('--race_jobs', type=int, default=0,
+						help='max jobs of num_episode episodes per candidate when racing, 0 to disable.\n needs --dispatch queue.')
+	parser.add_argument('--race_elite', type=float, default=0.25,
+						help='racing: fraction of the population above the cut the race is about.')
+	parser.add_argument('--race_z', type=float, default=1.0,
+						help='racing: candidates within this many standard errors of the cut get more jobs.')
+	parser.add_argument('--dream_screen', type=float, default=0,
+						help='fraction of the population that goes on from the dream env to the real env, 0 to disable.\n needs --dispatch queue.')
+	parser.add_argument('--dream_episode', type=int, default=4, help='dream episodes per candidate w/ --dream_screen')
+	parser.add_argument('--surrogate', type=str, default='',
+						help='ridge or rbf: fitness predictor that picks the candidates to evaluate, empty to disable.\n needs --dispatch queue.')
+	parser.add_argument('--surrogate_keep', type=float, default=0.5,
+						help='w/ --surrogate, popsize / surrogate_keep candidates are screened for the popsize evaluated.')
+	parser.add_argument('--reuse', type=int, default=0,
+						help='reuse the evaluations of this many previous generations w/ importance weights, 0 to disable.\n only works w/ ses, pepg, openes.')
+	parser.add_argument('--stop_window', type=int, default=0,
+						help='stop a training episode after this many steps w/o a new reward high, 0 to disable.')
+	parser.add_argument('--stop_quantile', type=float, default=0,
+						help='stop a training episode falling behind the reward per step of this quantile of the\n previous generation, 0 to disable.')
+	parser.add_argument('--stop_grace', type=int, default=100,
+						help='steps before an episode can be stopped for falling behind.')
 	parser.add_argument('--retrain', type=int, default=0,
 						help='set to 0 to disable retraining every eval_steps if results suck.\n only works w/ ses, openes, pepg.')
+	parser.add_argument('--async_quorum', type=float, default=0,
+						help='fraction of the population that triggers an asynchronous update, 0 to disable.\n needs --dispatch queue.')
+	parser.add_argument('--max_staleness', type=int, default=2, help='discard async results older than this many updates')
+	parser.add_argument('--staleness_decay', type=float, default=0.5, help='weight of an async result per update of age')
+	parser.add_argument('--cache_size', type=int, default=0,
+						help='max number of cached evaluation results, reused for repeated params and seeds. 0 to disable.')
+	parser.add_argument('--sweep', type=str, default='',
+						help='runs sharing the workers as optimizer:seed, comma separated, e.g. cma:0,pepg:0,ses:1.\n needs --dispatch queue.')
+	parser.add_argument('--sweep_generations', type=int, default=100, help='generations of each run of a sweep')
+	parser.add_argument('--master_eval', type=int, default=0,
+						help='set to 1 for the master to run jobs in a background thread when no worker is free.\n needs --dispatch queue.')
+	parser.add_argument('--job_retries', type=int, default=2, help='times a failed job is handed out again')
+	parser.add_argument('--job_timeout', type=float, default=0,
+						help='seconds after which a worker holding a job is taken out and the job handed to another, 0 waits forever.\n needs --dispatch queue.')
+	parser.add_argument('--straggler_ratio', type=float, default=0.5,
+						help='flag ranks below this fraction of the median env steps per second as stragglers')
+	parser.add_argument('--checkpoint_steps', type=int, default=25,
+						help='save optimizer, seeder and run state every checkpoint_steps generations, 0 to disable.')
+	parser.add_argument('--resume', type=int, default=0,
+						help='set to 1 to continue from the checkpoint of a previous run w/ the same settings.')
 	parser.add_argument('-s', '--seed_start', type=int, default=0, help='initial seed')
 	parser.add_argument('--sigma_init', type=float, default=0.1, help='sigma_init')
 	parser.add_argument('--sigma_decay', type=float, default=0.999, help='sigma_decay')
+	parser.add_argument('--noise_table', type=int, default=0,
+						help='set to 1 to send offsets into a shared noise table instead of parameters.\n only works w/ ses, openes, pepg.')
+	parser.add_argument('--low_memory', type=int, default=0,
+						help='set to 1 for float32 solutions and noise regenerated from seeds on the master.\n only works w/ ses, openes, pepg.')
+	parser.add_argument('--noise_table_size', type=int, default=10000000, help='number of floats in the noise table')
+	parser.add_argument('--noise_seed', type=int, default=123, help='seed of the noise table')
 
 	args = parser.parse_args()
-	if "parent" == mpi_fork(args.num_worker + 1): os.exit()
+	if args.backend == 'mpi' and "parent" == mpi_fork(args.num_worker + 1): os.exit()
 	main(args)
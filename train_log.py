@@ -0,0 +1,123 @@
+'''
+Training log of train.py.
+History records are appended to JSONL files (one JSON record per line) by a background thread, parameter files
+are snapshots that are replaced atomically, so the master never rewrites a growing file or waits on the disk.
+The read_* / load_* functions are the reader side, e.g. for plot_training_progress.ipynb.
+'''
+
+import atexit
+import json
+import os
+import queue
+import threading
+import numpy as np
+
+
+def _to_json(obj):
+	# numpy arrays and scalars handed to the writer are converted on the writer thread
+	if isinstance(obj, np.ndarray):
+		return obj.tolist()
+	if isinstance(obj, np.generic):
+		return obj.item()
+	raise TypeError(repr(obj) + " is not JSON serializable")
+
+
+class LogWriter:
+	'''Writes the files of a run on a background thread.
+	Objects passed to append/snapshot must not be modified afterwards.
+	append=False truncates the history files of a previous run with the same filebase on first use.'''
+
+	def __init__(self, append=False):
+		self.append_mode = append
+		self.files = {}
+		self.queue = queue.Queue()
+		self.thread = threading.Thread(target=self._run)
+		self.thread.daemon = True
+		self.thread.start()
+		atexit.register(self.close)
+
+	def append(self, filename, record):
+		self.queue.put(('append', filename, record, None))
+
+	def snapshot(self, filename, obj, **kwargs):
+		# kwargs go to json.dump, e.g. indent
+		self.queue.put(('snapshot', filename, obj, kwargs))
+
+	def flush(self):
+		# blocks until everything queued so far is on disk
+		self.queue.join()
+
+	def close(self):
+		if self.thread.is_alive():
+			self.queue.put(None)
+			self.thread.join()
+
+	def _run(self):
+		while True:
+			item = self.queue.get()
+			try:
+				if item is None:
+					for f in self.files.values():
+						f.close()
+					self.files = {}
+					return
+				kind, filename, obj, kwargs = item
+				if kind == 'append':
+					self._append(filename, obj)
+				else:
+					self._snapshot(filename, obj, kwargs)
+			finally:
+				self.queue.task_done()
+
+	def _append(self, filename, record):
+		f = self.files.get(filename)
+		if f is None:
+			f = open(filename, 'at' if self.append_mode else 'wt')
+			self.files[filename] = f
+		# a record is one write ending in a newline, a reader drops a line that is cut short
+		f.write(json.dumps(record, default=_to_json, separators=(',', ':')) + '\n')
+		f.flush()
+
+	def _snapshot(self, filename, obj, kwargs):
+		tmp = filename + '.tmp'
+		with open(tmp, 'wt') as out:
+			json.dump(obj, out, default=_to_json, **kwargs)
+		os.replace(tmp, filename)  # readers see either the old or the new file, never half of one
+
+
+def read_log(filename):
+	'''Returns the list of records of a .jsonl file, or the content of a .json file of older runs.'''
+	with open(filename, 'r') as f:
+		data = f.read()
+	if not filename.endswith('.jsonl'):
+		return json.loads(data)
+	data = data[:data.rfind('\n') + 1]  # the last record may still be being written
+	return json.loads('[' + ','.join(data.splitlines()) + ']')  # one parse for the whole file
+
+
+def _read_run_log(filebase, name):
+	filename = filebase + '.' + name + '.jsonl'
+	if not os.path.exists(filename):
+		filename = filebase + '.' + name + '.json'
+	return read_log(filename)
+
+
+def load_history(filebase):
+	'''Per generation: generation, time, mean, min, max, std of the rewards, rms of sigma, mean and max time steps.'''
+	return np.array(_read_run_log(filebase, 'hist'))
+
+
+def load_history_best(filebase):
+	'''Per evaluation: generation, time, "improvement", improvement, "curr", reward, "prev", reward, "best", reward.'''
+	return _read_run_log(filebase, 'hist_best')
+
+
+def load_eval_log(filebase):
+	'''Per evaluation: generation, reward, parameters.'''
+	return _read_run_log(filebase, 'log')
+
+
+def load_telemetry(filebase):
+	'''Per generation: dict of t, total, wait, master, compute, env, encode, control (seconds), steps,
+	steps_per_sec per worker rank and the stragglers, see Telemetry in train.py.'''
+	return read_log(filebase + '.telemetry.jsonl')
@@ -0,0 +1,147 @@
+'''
+Inference of the encoder of the ConvVAE of vae.py in NumPy, w/ the weights of the same vae.json.
+Every conv layer is one im2col copy and one matrix product for the whole batch, no TF graph or session per worker.
+python -m vae.numpy_vae from the repository root times an encode and checks it against ConvVAE (needs TensorFlow).
+'''
+
+import json
+import os
+import time
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+
+def im2col(x, kernel_size, stride):
+	# (batch, height, width, channels) -> (batch * out height * out width, kernel_size * kernel_size * channels),
+	# the patches of TF 'VALID' padding, in the (row, column, channel) order of a TF conv kernel
+	n, height, width, channels = x.shape
+	out_height = (height - kernel_size) // stride + 1
+	out_width = (width - kernel_size) // stride + 1
+	sn, sh, sw, sc = x.strides
+	patches = as_strided(x, shape=(n, out_height, out_width, kernel_size, kernel_size, channels),
+						 strides=(sn, sh * stride, sw * stride, sh, sw, sc), writeable=False)
+	return patches.reshape(n * out_height * out_width, -1), out_height, out_width
+
+
+class NumpyConvVAE:
+	'''The encoder of ConvVAE: load_json / set_model_params and encode / encode_mu_logvar on batches of
+	(batch, 64, 64, 3) frames in [0, 1]. vae.json holds the decoder too, its weights are skipped.'''
+
+	kernel_size = 4
+	stride = 2
+	# the trainable variables of the encoder, the first ones of ConvVAE in its order
+	param_names = ['conv1_w', 'conv1_b', 'conv2_w', 'conv2_b', 'conv3_w', 'conv3_b', 'conv4_w', 'conv4_b',
+				   'mu_w', 'mu_b', 'logvar_w', 'logvar_b']
+
+	def __init__(self, z_size=32):
+		self.z_size = z_size
+		channels = [3, 32, 64, 128, 256]
+		for i in range(4):
+			setattr(self, 'conv%d_w' % (i + 1), np.zeros((self.kernel_size, self.kernel_size, channels[i], channels[i + 1]),
+														 dtype=np.float32))
+			setattr(self, 'conv%d_b' % (i + 1), np.zeros(channels[i + 1], dtype=np.float32))
+		self.mu_w = np.zeros((2 * 2 * 256, z_size), dtype=np.float32)
+		self.mu_b = np.zeros(z_size, dtype=np.float32)
+		self.logvar_w = np.zeros((2 * 2 * 256, z_size), dtype=np.float32)
+		self.logvar_b = np.zeros(z_size, dtype=np.float32)
+		self.flatten_kernels()
+
+	def flatten_kernels(self):
+		# conv kernels as (kernel_size * kernel_size * in channels, out channels) matrices for the im2col product,
+		# mu and logvar as one dense layer
+		self.conv_layers = [(getattr(self, 'conv%d_w' % i).reshape(-1, getattr(self, 'conv%d_b' % i).shape[0]),
+							 getattr(self, 'conv%d_b' % i)) for i in range(1, 5)]
+		self.fc_w = np.ascontiguousarray(np.concatenate([self.mu_w, self.logvar_w], axis=1))
+		self.fc_b = np.concatenate([self.mu_b, self.logvar_b])
+
+	def encode_mu_logvar(self, x):
+		h = np.ascontiguousarray(x, dtype=np.float32).reshape(-1, 64, 64, 3)
+		n = h.shape[0]
+		for kernel, bias in self.conv_layers:
+			cols, out_height, out_width = im2col(h, self.kernel_size, self.stride)
+			h = np.dot(cols, kernel)
+			h += bias
+			np.maximum(h, 0, out=h)
+			h = h.reshape(n, out_height, out_width, -1)
+		out = np.dot(h.reshape(n, -1), self.fc_w) + self.fc_b  # same (row, column, channel) flattening as tf.reshape
+		return out[:, :self.z_size], out[:, self.z_size:]
+
+	def encode(self, x):
+		mu, logvar = self.encode_mu_logvar(x)
+		return mu + np.exp(logvar / 2.0) * np.random.randn(*logvar.shape).astype(np.float32)
+
+	def get_model_params(self):
+		model_params = [np.round(getattr(self, name) * 10000).astype(int).tolist() for name in self.param_names]
+		model_shapes = [getattr(self, name).shape for name in self.param_names]
+		return model_params, model_shapes, self.param_names
+
+	def get_random_model_params(self, stdev=0.5):
+		_, mshape, _ = self.get_model_params()
+		return [np.random.standard_cauchy(s) * stdev for s in mshape]
+
+	def set_model_params(self, params):
+		# the params of the whole ConvVAE or of the encoder only
+		for name, p in zip(self.param_names, params):
+			p = np.array(p)
+			assert getattr(self, name).shape == p.shape, "inconsistent shape"
+			setattr(self, name, (p.astype(float) / 10000.).astype(np.float32))
+		self.flatten_kernels()
+
+	def load_json(self, jsonfile='vae.json'):
+		with open(jsonfile, 'r') as f:
+			params = json.load(f)
+		self.set_model_params(params)
+
+	def set_random_params(self, stdev=0.5):
+		self.set_model_params(self.get_random_model_params(stdev))
+
+
+def check(jsonfile='vae/vae.json', batch_size=4, seed=0):
+	'''Max absolute difference of mu and logvar of NumpyConvVAE and ConvVAE on random frames.'''
+	from vae.vae import ConvVAE
+	tf_vae = ConvVAE(batch_size=batch_size, gpu_mode=False, is_training=False, reuse=True)
+	np_vae = NumpyConvVAE()
+	if os.path.exists(jsonfile):
+		tf_vae.load_json(jsonfile)
+		np_vae.load_json(jsonfile)
+	else:
+		tf_vae.set_random_params(stdev=0.01)
+		np_vae.set_model_params(tf_vae.get_model_params()[0])
+
+	rs = np.random.RandomState(seed)
+	x = rs.randint(0, 256, (batch_size, 64, 64, 3)).astype(np.float32) / 255.0
+	mu, logvar = tf_vae.encode_mu_logvar(x)
+	np_mu, np_logvar = np_vae.encode_mu_logvar(x)
+	return {'mu': float(np.max(np.abs(mu - np_mu))), 'logvar': float(np.max(np.abs(logvar - np_logvar)))}
+
+
+def benchmark(jsonfile='vae/vae.json', batch_sizes=(1, 16), steps=200):
+	'''Seconds per encode_mu_logvar call for each batch size, random weights if there is no jsonfile.'''
+	vae = NumpyConvVAE()
+	if os.path.exists(jsonfile):
+		vae.load_json(jsonfile)
+	else:
+		vae.set_random_params(stdev=0.01)
+	result = {}
+	for batch_size in batch_sizes:
+		x = np.random.rand(batch_size, 64, 64, 3).astype(np.float32)
+		start_time = time.time()
+		for t in range(steps):
+			vae.encode_mu_logvar(x)
+		result[batch_size] = (time.time() - start_time) / steps
+	return result
+
+
+if __name__ == '__main__':
+	for batch_size, encode_time in benchmark().items():
+		print("batch size", batch_size, "encode", round(encode_time * 1e6, 1), "us",
+			  round(encode_time * 1e6 / batch_size, 1), "us per frame")
+	try:
+		import tensorflow
+	except ImportError:
+		tensorflow = None
+		print("no TensorFlow, not checked against ConvVAE")
+	if tensorflow is not None:
+		diff = check()
+		print("max abs difference to ConvVAE", diff)
+		assert max(diff.values()) < 1e-3, "NumpyConvVAE does not match ConvVAE"
@@ -2,11 +2,22 @@
 
 import numpy as np
 import json
-import tensorflow as tf
 import os
+from vae.numpy_vae import NumpyConvVAE
+
+tf = None  # TensorFlow, imported by the first ConvVAE so that NumpyConvVAE runs w/o it
+
+
+def import_tf():
+	global tf
+	if tf is None:
+		import tensorflow
+		tf = tensorflow
+	return tf
 
 
 def reset_graph():
+	import_tf()
 	if 'sess' in globals() and sess:
 		sess.close()
 	tf.reset_default_graph()
@@ -15,6 +26,7 @@ def reset_graph():
 class ConvVAE(object):
 	def __init__(self, z_size=32, batch_size=1, learning_rate=0.0001, kl_tolerance=0.5, is_training=False, reuse=False,
 				 gpu_mode=False):
+		import_tf()
 		self.z_size = z_size
 		self.batch_size = batch_size
 		self.learning_rate = learning_rate
@@ -181,3 +193,11 @@ class ConvVAE(object):
 		print('loading model', ckpt.model_checkpoint_path)
 		tf.logging.info('Loading model %s.', ckpt.model_checkpoint_path)
 		saver.restore(sess, ckpt.model_checkpoint_path)
+
+
+def make_vae(batch_size=1, numpy_vae=False):
+	# ConvVAE on the cpu for inference, or the NumpyConvVAE encoder w/o TensorFlow, which is then never imported
+	# (encode only, no decode)
+	if numpy_vae:
+		return NumpyConvVAE()
+	return ConvVAE(batch_size=batch_size, gpu_mode=False, is_training=False, reuse=True)